@@ -1,6 +1,10 @@
-from django_filters.rest_framework import FilterSet, filters
+from django.db.models import F
+from django_filters.rest_framework import (DjangoFilterBackend, FilterSet,
+                                           filters)
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.facets import get_facets
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.write_behind import get_pending_ids
 
 
 class FilterIngredient(FilterSet):
@@ -11,6 +15,25 @@ class FilterIngredient(FilterSet):
         fields = ('name',)
 
 
+RANKING_ORDERINGS = {
+    'popular': (
+        F('score__score_all').desc(nulls_last=True),
+        'name',
+    ),
+    'trending': (
+        F('score__score_day').desc(nulls_last=True),
+        F('score__score_week').desc(nulls_last=True),
+        'name',
+    ),
+}
+
+# Списки пользователя для фильтров is_*
+USER_RELATIONS = {
+    'is_favorited': Favorite,
+    'is_in_shopping_cart': ShoppingCart,
+}
+
+
 class FilterRecipe(FilterSet):
     author = filters.NumberFilter(field_name='author__id')
     tags = filters.ModelMultipleChoiceFilter(
@@ -18,10 +41,71 @@ class FilterRecipe(FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
     )
-    is_favorited = filters.BooleanFilter(field_name='is_favorited')
+    is_favorited = filters.BooleanFilter(method='filter_user_recipes')
     is_in_shopping_cart = filters.BooleanFilter(
-        field_name='is_in_shopping_cart')
+        method='filter_user_recipes')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('popular', 'Популярные'),
+            ('trending', 'Набирающие популярность'),
+        ),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'is_in_shopping_cart', 'is_favorited', 'tags')
+
+    def filter_user_recipes(self, queryset, name, value):
+        if not value:
+            return queryset.filter(**{name: False})
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        model = USER_RELATIONS[name]
+        if any(get_pending_ids(model, user.id)):
+            # Аннотация уже учитывает ещё не записанные переключения
+            return queryset.filter(**{name: True})
+        # Выборка начинается со строк пользователя по индексу
+        # (user, recipe), а не с подзапроса для каждого рецепта
+        return queryset.filter(
+            **{f'{model._meta.default_related_name}__user': user})
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RANKING_ORDERINGS[value])
+
+    def filter_queryset_without(self, *names):
+        """Выборка по уже проверенным фильтрам, кроме names."""
+        queryset = self.queryset
+        for name, value in self.form.cleaned_data.items():
+            if name not in names:
+                queryset = self.filters[name].filter(queryset, value)
+        return queryset
+
+    def get_facets(self):
+        """Фасеты по уже проверенным фильтрам."""
+        data = self.form.cleaned_data
+        params = None
+        if all(data.get(name) is None for name in USER_RELATIONS):
+            # Личные списки пользователя в ключ кеша не попадают
+            params = {
+                'author': (
+                    None if data.get('author') is None
+                    else str(data['author'])
+                ),
+                'tags': sorted({tag.slug for tag in data.get('tags') or ()}),
+            }
+        # Счётчики тегов без фильтра по тегам: теги в фильтре
+        # объединяются через ИЛИ, и счётчик показывает, сколько рецептов
+        # будет при выборе тега
+        return get_facets(
+            params, self.qs, self.filter_queryset_without('tags'))
+
+
+class KeepFilterSetBackend(DjangoFilterBackend):
+    """Оставляет проверенный набор фильтров во view: фасеты считаются
+    по нему без повторной проверки параметров."""
+
+    def get_filterset(self, request, queryset, view):
+        view.filterset = super().get_filterset(request, queryset, view)
+        return view.filterset
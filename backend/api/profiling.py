@@ -0,0 +1,127 @@
+"""Профилирование отдельных запросов по требованию персонала.
+
+Запрос с параметром ?_profile или заголовком X-Profile от пользователя,
+прошедшего IsAdminUser, выполняется под cProfile с записью всех
+SQL-запросов. Отчёт сохраняется в PROFILING_DIR: <id>.prof для
+pstats/snakeviz и <id>.json со сводкой и списком запросов; id
+возвращается в заголовке X-Profile-Id. Для остальных запросов
+middleware ничего не делает.
+"""
+import cProfile
+import io
+import json
+import pstats
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from foodgram.const import (PROFILE_HEADER, PROFILE_QUERY_PARAM,
+                            PROFILE_REPORT_LINES)
+
+
+class QueryLog:
+    """execute_wrapper, записывающий SQL и время каждого запроса."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params),
+                'duration_ms': (time.perf_counter() - start) * 1000,
+            })
+
+
+def is_profiling_requested(request):
+    return (PROFILE_HEADER in request.META
+            or PROFILE_QUERY_PARAM in request.GET)
+
+
+def is_staff_request(request):
+    """Проверка IsAdminUser с аутентификацией API до вызова view."""
+    drf_request = Request(request, authenticators=[
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        return IsAdminUser().has_permission(drf_request, None)
+    except APIException:
+        return False
+
+
+def get_report_path(report_id, suffix):
+    return Path(settings.PROFILING_DIR) / f'{report_id}{suffix}'
+
+
+def save_report(request, response, profiler, query_log, duration):
+    report_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+    Path(settings.PROFILING_DIR).mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(get_report_path(report_id, '.prof'))
+    stats = io.StringIO()
+    pstats.Stats(profiler, stream=stats).sort_stats(
+        'cumulative'
+    ).print_stats(PROFILE_REPORT_LINES)
+    report = {
+        'id': report_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.pk,
+        'status': response.status_code,
+        'duration_ms': duration * 1000,
+        'query_count': len(query_log.queries),
+        'query_time_ms': sum(
+            query['duration_ms'] for query in query_log.queries),
+        'queries': query_log.queries,
+        'stats': stats.getvalue(),
+    }
+    with open(get_report_path(report_id, '.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    return report_id
+
+
+def load_report(report_id):
+    with open(get_report_path(report_id, '.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiling_requested(request) or not is_staff_request(
+                request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        query_log = QueryLog()
+        start = time.perf_counter()
+        with connection.execute_wrapper(query_log):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming:
+                    # Потоковое тело формируется уже после view
+                    response.streaming_content = [
+                        b''.join(response.streaming_content)
+                    ]
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+        response['X-Profile-Id'] = save_report(
+            request, response, profiler, query_log, duration
+        )
+        return response
@@ -1,7 +1,17 @@
+import os
+import re
 from base64 import b64decode
+from binascii import Error as Base64Error
+from contextlib import suppress
+from operator import attrgetter
+from tempfile import NamedTemporaryFile
+from weakref import finalize
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
@@ -11,6 +21,9 @@ from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
 from foodgram.const import (
     AMOUNT_MIN,
     AMOUNT_MAX,
+    IMAGE_DECODE_CHUNK_SIZE,
+    INGREDIENT_SEARCH_MAX_INGREDIENTS,
+    RECIPE_BATCH_MAX_IDS,
     TIME_COOK_VALUE_MIN,
     TIME_COOK_VALUE_MAX
 )
@@ -18,15 +31,110 @@ from foodgram.const import (
 User = get_user_model()
 
 
+def parse_field_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_requested_fields(request, field_names):
+    """Поля из ?fields= / ?omit= в исходном порядке, id отдаётся всегда."""
+    if request is None:
+        return tuple(field_names)
+    params = request.query_params
+    selected = field_names
+    if params.get('fields'):
+        requested = parse_field_names(params['fields'])
+        selected = [
+            name for name in selected if name in requested or name == 'id'
+        ]
+    if params.get('omit'):
+        omitted = parse_field_names(params['omit']) - {'id'}
+        selected = [name for name in selected if name not in omitted]
+    return tuple(selected)
+
+
+class SparseFieldsMixin:
+    """Поддержка ?fields= и ?omit= для сериализатора верхнего уровня."""
+
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_top_level():
+            return fields
+        requested = get_requested_fields(self.context.get('request'), fields)
+        return {name: fields[name] for name in requested}
+
+
+def remove_file(path):
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class DecodedImageFile(File):
+    """Временный файл с декодированной картинкой.
+
+    Удаляется вместе с объектом, если хранилище не переместило его.
+    """
+
+    def __init__(self, name, content_type):
+        file = NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False
+        )
+        super().__init__(file, name)
+        self.content_type = content_type
+        finalize(self, remove_file, file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+NON_BASE64_CHARS = re.compile('[^A-Za-z0-9+/=]')
+
+
 class Base64ImageFieldDecoder(serializers.ImageField):
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, separator, imgstr = data.partition(';base64,')
+            if not separator:
+                self.fail('invalid_image')
             ext = format.split('/')[-1]
-            data = ContentFile(b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext, format[len('data:'):])
         return super().to_internal_value(data)
 
+    def decode(self, imgstr, name, content_type):
+        """Декодирует base64 частями во временный файл на диске.
+
+        Картинка не копируется в память целиком: проверка Pillow и
+        хранилище работают с файлом по пути, FileSystemStorage его
+        перемещает, S3 загружает потоком.
+        """
+        file = DecodedImageFile(name, content_type)
+        rest = ''
+        try:
+            for start in range(0, len(imgstr), IMAGE_DECODE_CHUNK_SIZE):
+                # Переводы строк (base64 по RFC 2045) и прочие символы,
+                # которые b64decode пропускает, сбили бы выравнивание по
+                # 4 символа: они удаляются, а неполная четвёрка переходит
+                # в следующую часть
+                chunk = rest + NON_BASE64_CHARS.sub(
+                    '', imgstr[start:start + IMAGE_DECODE_CHUNK_SIZE])
+                aligned = len(chunk) - len(chunk) % 4
+                file.write(b64decode(chunk[:aligned]))
+                rest = chunk[aligned:]
+            # Неполная четвёрка в конце - ошибка заполнения
+            file.write(b64decode(rest))
+        except (Base64Error, ValueError):
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
 
 class UserSerializerReg(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
@@ -69,7 +177,7 @@ class UserSerializerSubscribe(serializers.ModelSerializer):
         return data
 
 
-class UserSerializerProfile(UserSerializer):
+class UserSerializerProfile(SparseFieldsMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
 
@@ -96,9 +204,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
 
 class UserSerializerSubscribeRepresentation(UserSerializerProfile):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True
-    )
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -107,7 +213,7 @@ class UserSerializerSubscribeRepresentation(UserSerializerProfile):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes = obj.recipes.all()
+        recipes = obj.recipes.filter(pending_deletion=False)
         recipes_limit = request.query_params.get('recipes_limit')
 
         if recipes_limit:
@@ -121,23 +227,25 @@ class UserSerializerSubscribeRepresentation(UserSerializerProfile):
         )
         return serializer.data
 
+    def get_recipes_count(self, obj):
+        return obj.recipes.filter(pending_deletion=False).count()
+
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'slug')
 
 
 class SerializerRecipeIngredientInput(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient', queryset=Ingredient.objects.all()
-    )
+    # Ингредиенты загружаются разом в SerializerRecipeCreateUpdate.validate
+    id = serializers.IntegerField(source='ingredient')
     amount = serializers.IntegerField(
         min_value=AMOUNT_MIN,
         max_value=AMOUNT_MAX
@@ -160,7 +268,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class DetailRecipeSerializer(serializers.ModelSerializer):
+class DetailRecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializerProfile(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -179,6 +287,129 @@ class DetailRecipeSerializer(serializers.ModelSerializer):
         )
 
 
+def build_image_url(image, request):
+    if not image:
+        return None
+    url = image.storage.url(image.name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class FastDetailRecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        if 'author' in self.child.field_names:
+            self.child.load_subscriptions(
+                {recipe.author_id for recipe in recipes}
+            )
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
+class FastDetailRecipeSerializer(serializers.BaseSerializer):
+    """Read-only представление рецепта без дерева полей DRF.
+
+    Формирует тот же JSON, что и DetailRecipeSerializer, из
+    предзагруженных строк queryset'а RecipeViewSet.
+    """
+
+    # Порядок ключей совпадает с DetailRecipeSerializer.Meta.fields
+    all_field_names = DetailRecipeSerializer.Meta.fields
+    author_fields = (
+        ('id', attrgetter('id')),
+        ('username', attrgetter('username')),
+        ('email', attrgetter('email')),
+        ('first_name', attrgetter('first_name')),
+        ('last_name', attrgetter('last_name')),
+    )
+    get_tag = attrgetter('id', 'name', 'slug')
+    get_ingredient = attrgetter(
+        'ingredient.id', 'ingredient.name',
+        'ingredient.measurement_unit', 'amount'
+    )
+
+    class Meta:
+        list_serializer_class = FastDetailRecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subscribed_author_ids = None
+        self.field_names = get_requested_fields(
+            self.context.get('request'), self.all_field_names
+        )
+        self.renderers = tuple(
+            (name, getattr(self, f'render_{name}'))
+            for name in self.field_names
+        )
+
+    def load_subscriptions(self, author_ids):
+        user = self.context['request'].user
+        if not user.is_authenticated or not author_ids:
+            self.subscribed_author_ids = set()
+            return
+        self.subscribed_author_ids = set(
+            user.subscriber.filter(author_id__in=author_ids)
+            .values_list('author_id', flat=True)
+        )
+
+    def render_id(self, instance):
+        return instance.id
+
+    def render_author(self, instance):
+        author = instance.author
+        if self.subscribed_author_ids is None:
+            self.load_subscriptions({author.id})
+        data = {key: getter(author) for key, getter in self.author_fields}
+        data['avatar'] = build_image_url(
+            author.avatar, self.context['request'])
+        data['is_subscribed'] = author.id in self.subscribed_author_ids
+        return data
+
+    def render_tags(self, instance):
+        get_tag = self.get_tag
+        tags = []
+        for tag in instance.tags.all():
+            tag_id, name, slug = get_tag(tag)
+            tags.append({'id': tag_id, 'name': name, 'slug': slug})
+        return tags
+
+    def render_ingredients(self, instance):
+        get_ingredient = self.get_ingredient
+        ingredients = []
+        for recipe_ingredient in instance.recipe_ingredients.all():
+            ingredient_id, name, unit, amount = get_ingredient(
+                recipe_ingredient)
+            ingredients.append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+        return ingredients
+
+    def render_is_favorited(self, instance):
+        return bool(getattr(instance, 'is_favorited', False))
+
+    def render_name(self, instance):
+        return instance.name
+
+    def render_image(self, instance):
+        return build_image_url(instance.image, self.context['request'])
+
+    def render_is_in_shopping_cart(self, instance):
+        return bool(getattr(instance, 'is_in_shopping_cart', False))
+
+    def render_text(self, instance):
+        return instance.text
+
+    def render_cooking_time(self, instance):
+        return instance.cooking_time
+
+    def to_representation(self, instance):
+        return {name: render(instance) for name, render in self.renderers}
+
+
 class SerializerBaseRecipeAction(serializers.ModelSerializer):
     class Meta:
         fields = ('recipe', 'user')
@@ -189,10 +420,15 @@ class SerializerBaseRecipeAction(serializers.ModelSerializer):
         ).data
 
 
+def resolve_objects(model, ids):
+    """Объекты по списку id одним запросом и отсутствующие id."""
+    objects = model.objects.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in objects]
+    return [objects[pk] for pk in ids if pk in objects], missing
+
+
 class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = SerializerRecipeIngredientInput(many=True)
     image = Base64ImageFieldDecoder()
     cooking_time = serializers.IntegerField(
@@ -213,7 +449,7 @@ class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
             })
 
         ingredient_ids = [
-            ingredient['ingredient'].id for ingredient in ingredients
+            ingredient['ingredient'] for ingredient in ingredients
         ]
         if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError({
@@ -226,11 +462,30 @@ class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
                 'tags': 'У рецепта должен  быть хотя бы 1 тег.'
             })
 
-        tag_ids = [tag.id for tag in tags]
-        if len(tag_ids) != len(set(tag_ids)):
+        if len(tags) != len(set(tags)):
             raise serializers.ValidationError({
                 'tags': 'Теги должны быть уникальными.'
             })
+
+        # По одному запросу на модель вместо запроса на каждый id
+        found_ingredients, missing_ingredients = resolve_objects(
+            Ingredient, ingredient_ids
+        )
+        data['tags'], missing_tags = resolve_objects(Tag, tags)
+        errors = {}
+        if missing_ingredients:
+            errors['ingredients'] = (
+                'Ингредиенты не существуют: '
+                f'{", ".join(map(str, missing_ingredients))}.'
+            )
+        if missing_tags:
+            errors['tags'] = (
+                f'Теги не существуют: {", ".join(map(str, missing_tags))}.'
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        for ingredient, found in zip(ingredients, found_ingredients):
+            ingredient['ingredient'] = found
         return data
 
     def assign_ingredients_to_recipe(self, recipe, ingredients):
@@ -242,6 +497,7 @@ class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
             ) for ingredient_data in ingredients
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -252,6 +508,7 @@ class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
         self.assign_ingredients_to_recipe(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -262,6 +519,7 @@ class SerializerRecipeCreateUpdate(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], 'recipe_ingredients__ingredient')
         return DetailRecipeSerializer(instance, context=self.context).data
 
 
@@ -287,3 +545,52 @@ class SerializerRecipeShoppingCart(SerializerBaseRecipeAction):
                 fields=('user', 'recipe'),
             )
         ]
+
+
+class IngredientSearchSerializer(serializers.Serializer):
+    ingredients = serializers.CharField()
+    mode = serializers.ChoiceField(
+        choices=('all', 'any', 'missing'), default='any'
+    )
+    max_missing = serializers.IntegerField(min_value=0, default=1)
+
+    def validate_ingredients(self, value):
+        try:
+            ingredient_ids = {
+                int(pk) for pk in value.split(',') if pk.strip()
+            }
+        except ValueError:
+            raise serializers.ValidationError(
+                'Укажите id ингредиентов через запятую.')
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                'Укажите хотя бы 1 ингредиент.')
+        if len(ingredient_ids) > INGREDIENT_SEARCH_MAX_INGREDIENTS:
+            raise serializers.ValidationError(
+                'Слишком много ингредиентов, максимум '
+                f'{INGREDIENT_SEARCH_MAX_INGREDIENTS}.')
+        return ingredient_ids
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    ids = serializers.CharField()
+
+    def validate_ids(self, value):
+        try:
+            # Без повторов, в порядке запроса
+            recipe_ids = list(dict.fromkeys(
+                int(pk) for pk in value.split(',') if pk.strip()
+            ))
+        except ValueError:
+            raise serializers.ValidationError(
+                'Укажите id рецептов через запятую.')
+        if not recipe_ids:
+            raise serializers.ValidationError('Укажите хотя бы 1 рецепт.')
+        if len(recipe_ids) > RECIPE_BATCH_MAX_IDS:
+            raise serializers.ValidationError(
+                f'Слишком много рецептов, максимум {RECIPE_BATCH_MAX_IDS}.')
+        return recipe_ids
+
+
+class RecipeFacetsSerializer(serializers.Serializer):
+    facets = serializers.BooleanField(default=False)
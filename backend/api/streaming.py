@@ -0,0 +1,41 @@
+import json
+
+from django.http import StreamingHttpResponse
+
+from foodgram.const import STREAM_CHUNK_SIZE
+from .serializers import get_requested_fields
+
+# Те же параметры, что у rest_framework.renderers.JSONRenderer
+encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_json_array(queryset, fields, chunk_size=STREAM_CHUNK_SIZE):
+    """Отдаёт JSON-массив объектов по частям, по chunk_size строк."""
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    encode = encoder.encode
+    yield '['
+    separator = ''
+    chunk = []
+    for row in rows:
+        chunk.append(encode(dict(zip(fields, row))))
+        if len(chunk) == chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield ']'
+
+
+class StreamingListMixin:
+    """Потоковая выдача list() для больших справочников без пагинации."""
+
+    stream_fields = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = get_requested_fields(request, self.stream_fields)
+        return StreamingHttpResponse(
+            iter_json_array(queryset, fields),
+            content_type='application/json',
+        )
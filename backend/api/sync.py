@@ -0,0 +1,88 @@
+"""Инкрементальная синхронизация списков по ?updated_since=<курсор>.
+
+Курсор непрозрачен для клиента: это base64 от позиции в изменённых
+объектах (updated_at, id) и в журнале удалений (id записи Tombstone).
+Пустой курсор означает синхронизацию с начала.
+
+updated_at и id выдаются до фиксации транзакции, поэтому строка,
+зафиксированная позже соседних, оказалась бы позади уже выданного
+курсора. Ответ содержит только изменения старше SYNC_LAG: к этому
+времени все более ранние транзакции уже зафиксированы.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from foodgram.const import SYNC_LAG, SYNC_PAGE_SIZE, SYNC_QUERY_PARAM
+from recipes.models import Tombstone
+
+
+def encode_cursor(position):
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(value):
+    if not value:
+        return {'updated_at': None, 'id': 0, 'deleted': 0}
+    try:
+        position = json.loads(urlsafe_b64decode(value.encode()))
+        position = {
+            'updated_at': position['updated_at'],
+            'id': int(position['id']),
+            'deleted': int(position['deleted']),
+        }
+        if position['updated_at'] is not None and parse_datetime(
+                position['updated_at']) is None:
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
+        raise ValidationError({SYNC_QUERY_PARAM: 'Некорректный курсор.'})
+    return position
+
+
+class SyncListMixin:
+    """list() с ?updated_since возвращает только изменённые объекты и id
+    удалённых, порциями не больше SYNC_PAGE_SIZE."""
+
+    def get_changed(self, position, settled):
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            updated_at__lte=settled
+        ).order_by('updated_at', 'id')
+        if position['updated_at'] is not None:
+            updated_at = parse_datetime(position['updated_at'])
+            queryset = queryset.filter(
+                Q(updated_at__gt=updated_at)
+                | Q(updated_at=updated_at, id__gt=position['id'])
+            )
+        return list(queryset[:SYNC_PAGE_SIZE])
+
+    def get_deleted(self, position, settled):
+        return list(Tombstone.objects.filter(
+            model=self.get_queryset().model._meta.model_name,
+            id__gt=position['deleted'],
+            deleted_at__lte=settled,
+        ).order_by('id').values_list('id', 'object_id')[:SYNC_PAGE_SIZE])
+
+    def list(self, request, *args, **kwargs):
+        if SYNC_QUERY_PARAM not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        position = decode_cursor(request.query_params[SYNC_QUERY_PARAM])
+        settled = timezone.now() - timedelta(seconds=SYNC_LAG)
+        changed = self.get_changed(position, settled)
+        deleted = self.get_deleted(position, settled)
+        if changed:
+            position['updated_at'] = changed[-1].updated_at.isoformat()
+            position['id'] = changed[-1].id
+        if deleted:
+            position['deleted'] = deleted[-1][0]
+        return Response({
+            'results': self.get_serializer(changed, many=True).data,
+            'deleted': [object_id for _, object_id in deleted],
+            'cursor': encode_cursor(position),
+            'has_more': SYNC_PAGE_SIZE in (len(changed), len(deleted)),
+        })
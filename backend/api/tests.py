@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Subscribe, Tag)
+from .serializers import DetailRecipeSerializer, FastDetailRecipeSerializer
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+
+class FastDetailRecipeSerializerTest(TestCase):
+    """FastDetailRecipeSerializer отдаёт побайтно тот же JSON, что и
+    DetailRecipeSerializer, на queryset'е RecipeViewSet."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='pass12345!',
+            avatar='users/author.png',
+        )
+        cls.other_author = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Другой', last_name='Автор', password='pass12345!',
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Рецептов',
+            password='pass12345!',
+        )
+        breakfast = Tag.objects.create(name='Завтрак', slug='breakfast')
+        lunch = Tag.objects.create(name='Обед', slug='lunch')
+        flour = Ingredient.objects.create(
+            name='Мука', measurement_unit='г')
+        milk = Ingredient.objects.create(
+            name='Молоко', measurement_unit='мл')
+        cls.pancakes = Recipe.objects.create(
+            author=cls.author, name='Блины', text='Смешать и пожарить.',
+            image='recipes/pancakes.png', cooking_time=30,
+        )
+        cls.pancakes.tags.set((breakfast, lunch))
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(recipe=cls.pancakes, ingredient=flour,
+                             amount=200),
+            RecipeIngredient(recipe=cls.pancakes, ingredient=milk,
+                             amount=500),
+        ))
+        cls.porridge = Recipe.objects.create(
+            author=cls.other_author, name='Каша', text='Сварить.',
+            image='recipes/porridge.png', cooking_time=15,
+        )
+        cls.porridge.tags.set((breakfast,))
+        RecipeIngredient.objects.create(
+            recipe=cls.porridge, ingredient=milk, amount=300)
+        Subscribe.objects.create(user=cls.reader, author=cls.author)
+        Favorite.objects.create(user=cls.reader, recipe=cls.pancakes)
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.porridge)
+
+    def render(self, serializer_class, action, user=None, query='', pk=None):
+        request = APIRequestFactory().get(f'/api/recipes/{query}')
+        if user is not None:
+            force_authenticate(request, user)
+        view = RecipeViewSet(action_map={'get': action}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        queryset = view.get_queryset()
+        context = {'request': view.request}
+        if pk is None:
+            serializer = serializer_class(queryset, many=True,
+                                          context=context)
+        else:
+            serializer = serializer_class(queryset.get(pk=pk),
+                                          context=context)
+        return JSONRenderer().render(serializer.data)
+
+    def assert_same_output(self, action, **kwargs):
+        expected = self.render(DetailRecipeSerializer, action, **kwargs)
+        self.assertEqual(
+            self.render(FastDetailRecipeSerializer, action, **kwargs),
+            expected,
+        )
+        return expected
+
+    def test_list(self):
+        for user in (None, self.reader, self.author):
+            with self.subTest(user=user):
+                self.assert_same_output('list', user=user)
+
+    def test_detail(self):
+        for user in (None, self.reader, self.author):
+            for recipe in (self.pancakes, self.porridge):
+                with self.subTest(user=user, recipe=recipe):
+                    self.assert_same_output(
+                        'retrieve', user=user, pk=recipe.pk)
+
+    def test_sparse_fields(self):
+        for query in ('?fields=name,author', '?omit=text,ingredients'):
+            with self.subTest(query=query):
+                self.assert_same_output('list', user=self.reader,
+                                        query=query)
+
+    def test_user_flags(self):
+        # Проверка, что сравнение не проходит на одних значениях False
+        output = self.assert_same_output(
+            'retrieve', user=self.reader, pk=self.pancakes.pk)
+        self.assertIn(b'"is_subscribed":true', output)
+        self.assertIn(b'"is_favorited":true', output)
+        output = self.assert_same_output(
+            'retrieve', user=self.reader, pk=self.porridge.pk)
+        self.assertIn(b'"is_in_shopping_cart":true', output)
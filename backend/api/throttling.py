@@ -0,0 +1,137 @@
+"""Ограничение частоты и параллельности дорогих запросов API."""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import SimpleRateThrottle
+
+from foodgram.const import CONCURRENCY_RETRY_AFTER
+
+SHEDDING_KINDS = ('throttled', 'concurrency')
+semaphores = {}
+semaphores_lock = threading.Lock()
+
+
+def record_shedding(scope, kind):
+    key = f'load_shedding:{scope}:{kind}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add и incr
+        cache.set(key, 1, None)
+
+
+def get_shedding_stats():
+    scopes = set(settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']).union(
+        settings.CONCURRENCY_LIMITS
+    )
+    keys = {
+        f'load_shedding:{scope}:{kind}': (scope, kind)
+        for scope in scopes for kind in SHEDDING_KINDS
+    }
+    values = cache.get_many(keys)
+    stats = {scope: dict.fromkeys(SHEDDING_KINDS, 0) for scope in scopes}
+    for key, value in values.items():
+        scope, kind = keys[key]
+        stats[scope][kind] = value
+    return stats
+
+
+def get_semaphore(scope):
+    with semaphores_lock:
+        if scope not in semaphores:
+            semaphores[scope] = threading.BoundedSemaphore(
+                settings.CONCURRENCY_LIMITS[scope]
+            )
+        return semaphores[scope]
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket в общем кэше, отдельный для пользователя и scope.
+
+    Ёмкость и скорость пополнения задаются строкой вида '10/m' в
+    DEFAULT_THROTTLE_RATES. Чтение и запись корзины не атомарны, при
+    гонке возможен небольшой перерасход.
+    """
+
+    cache_format = 'throttle_bucket_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        # Scope зависит от действия, поэтому определяется в allow_request
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        get_scope = getattr(view, 'get_throttle_scope', None)
+        self.scope = get_scope() if get_scope else None
+        if self.scope not in self.THROTTLE_RATES:
+            return True
+        capacity, duration = self.parse_rate(self.get_rate())
+        refill = capacity / duration
+        cost = min(view.get_throttle_cost(), capacity)
+        key = self.get_cache_key(request, view)
+        now = self.timer()
+        tokens, updated = self.cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens < cost:
+            self.wait_seconds = (cost - tokens) / refill
+            record_shedding(self.scope, 'throttled')
+            return False
+        self.cache.set(key, (tokens - cost, now), duration)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ThrottleScopeMixin:
+    """Scope троттлинга по действию и лимит параллельных запросов.
+
+    throttle_scopes сопоставляет действие вьюсета со scope. Для scope из
+    CONCURRENCY_LIMITS процесс выполняет не больше указанного числа
+    таких запросов одновременно, остальные получают 429.
+    """
+
+    throttle_scopes = {}
+
+    def get_throttle_scope(self):
+        return self.throttle_scopes.get(self.action)
+
+    def get_throttle_cost(self):
+        return 1
+
+    def initial(self, request, *args, **kwargs):
+        self.concurrency_semaphore = None
+        super().initial(request, *args, **kwargs)
+        scope = self.get_throttle_scope()
+        if scope not in settings.CONCURRENCY_LIMITS:
+            return
+        semaphore = get_semaphore(scope)
+        if not semaphore.acquire(blocking=False):
+            record_shedding(scope, 'concurrency')
+            raise Throttled(wait=CONCURRENCY_RETRY_AFTER)
+        self.concurrency_semaphore = semaphore
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        semaphore = getattr(self, 'concurrency_semaphore', None)
+        if semaphore is None:
+            return response
+        self.concurrency_semaphore = None
+        if response.streaming:
+            # Тело потокового ответа формируется уже после выхода из
+            # вьюхи: слот освобождается, когда сервер закроет ответ, в том
+            # числе при обрыве соединения до начала выдачи
+            response._resource_closers.append(semaphore.release)
+        else:
+            semaphore.release()
+        return response
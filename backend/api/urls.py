@@ -1,7 +1,8 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, LoadSheddingView, ProfileReportView,
+                    RecipeViewSet, TagViewSet, UserViewSet)
 
 v1_router = DefaultRouter()
 v1_router.register('ingredients', IngredientViewSet, basename='ingredients')
@@ -11,6 +12,9 @@ v1_router.register('tags', TagViewSet, basename='tags')
 
 
 urlpatterns = [
+    path('load-shedding/', LoadSheddingView.as_view()),
+    re_path(r'^profiles/(?P<report_id>[\w-]+)/$',
+            ProfileReportView.as_view()),
     path('', include(v1_router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
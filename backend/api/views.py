@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Q, Sum, Value
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
@@ -10,16 +12,35 @@ from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from foodgram.const import SUBSCRIPTION_RECIPES_PER_TOKEN, SYNC_QUERY_PARAM
+from recipes.deletion import request_deletion
+from recipes.facets import invalidate_facets
+from recipes.feed import (enqueue_backfill, enqueue_fan_out,
+                          feed_recipe_ids, remove_subscription)
+from recipes.ingredient_index import ingredient_index, log_recipe_change
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
-from .filters import FilterIngredient, FilterRecipe
+                            ShoppingCart, SimilarRecipe, Tag)
+from recipes.ranking import record_activity
+from recipes.write_behind import (get_pending_ids, get_toggle_log,
+                                  is_in_list, merge_pending)
+from .filters import FilterIngredient, FilterRecipe, KeepFilterSetBackend
 from .permissions import IsAdminAuthorOrReadOnly
+from .profiling import load_report
+from .streaming import StreamingListMixin
+from .sync import SyncListMixin
+from .throttling import ThrottleScopeMixin, get_shedding_stats
 from .serializers import (SerializerFavoriteRecipe, IngredientSerializer,
                           SerializerRecipeCreateUpdate,
-                          DetailRecipeSerializer,
+                          FastDetailRecipeSerializer,
+                          get_requested_fields,
+                          IngredientSearchSerializer,
+                          RecipeBatchSerializer,
+                          RecipeFacetsSerializer,
                           SerializerRecipeShoppingCart, AvatarSerializer,
                           TagSerializer, UserSerializerProfile,
                           UserSerializerSubscribeRepresentation,
@@ -29,10 +50,24 @@ from .serializers import (SerializerFavoriteRecipe, IngredientSerializer,
 User = get_user_model()
 
 
-class UserViewSet(DjoserUserViewSet):
+class UserViewSet(ThrottleScopeMixin, SyncListMixin, DjoserUserViewSet):
 
-    queryset = User.objects.all()
+    queryset = User.objects.filter(pending_deletion=False)
     serializer_class = UserSerializerProfile
+    throttle_scopes = {
+        'subscriptions': 'subscriptions',
+        'set_avatar': 'uploads',
+    }
+
+    def get_throttle_cost(self):
+        if self.action != 'subscriptions':
+            return 1
+        try:
+            recipes_limit = int(
+                self.request.query_params.get('recipes_limit', 0))
+        except ValueError:
+            recipes_limit = 0
+        return 1 + max(recipes_limit, 0) // SUBSCRIPTION_RECIPES_PER_TOKEN
 
     @action(
         methods=('get',),
@@ -43,13 +78,19 @@ class UserViewSet(DjoserUserViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    @staticmethod
+    def get_subscriptions(user):
+        return User.objects.filter(
+            subscribing__user=user, pending_deletion=False
+        )
+
     @action(
         methods=('get',),
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        queryset = self.get_subscriptions(request.user)
         page = self.paginate_queryset(queryset)
         serializer = UserSerializerSubscribeRepresentation(
             page, many=True, context={'request': request}
@@ -62,23 +103,24 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
+        author = get_object_or_404(User, id=id, pending_deletion=False)
         data = {'user': request.user.id, 'author': author.id}
         serializer = UserSerializerSubscribe(
             data=data,
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            enqueue_backfill(request.user.id, author.id)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED
         )
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
-        deleted, _ = request.user.subscriber.filter(author=author).delete()
-        if deleted:
+        author = get_object_or_404(User, id=id, pending_deletion=False)
+        if remove_subscription(request.user.id, author.id):
             return Response(status=status.HTTP_204_NO_CONTENT)
         raise ValidationError('На этого пользователя вы не подписаны.')
 
@@ -102,44 +144,82 @@ class UserViewSet(DjoserUserViewSet):
         request.user.avatar.delete(save=True)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def perform_destroy(self, instance):
+        request_deletion(instance)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ThrottleScopeMixin, SyncListMixin, StreamingListMixin,
+                        viewsets.ReadOnlyModelViewSet):
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    stream_fields = ('id', 'name', 'measurement_unit')
     pagination_class = None
     permission_classes = (AllowAny,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = FilterIngredient
 
+    def get_throttle_scope(self):
+        # Дорог только полный справочник, поиск по имени и порции
+        # синхронизации не ограничиваем
+        params = self.request.query_params
+        if (self.action == 'list' and not params.get('name')
+                and SYNC_QUERY_PARAM not in params):
+            return 'catalog'
+        return None
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(SyncListMixin, StreamingListMixin,
+                 viewsets.ReadOnlyModelViewSet):
 
     queryset = Tag.objects.all()
+    stream_fields = ('id', 'name', 'slug')
     pagination_class = None
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ThrottleScopeMixin, SyncListMixin, viewsets.ModelViewSet):
 
     permission_classes = (IsAdminAuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (KeepFilterSetBackend,)
     filterset_class = FilterRecipe
     http_method_names = ['get', 'post', 'patch', 'delete']
+    throttle_scopes = {
+        'download_shopping_cart': 'shopping_cart',
+        'create': 'uploads',
+        'partial_update': 'uploads',
+    }
+    read_actions = ('list', 'retrieve', 'feed', 'by_ingredients', 'similar',
+                    'batch')
 
     def get_queryset(self):
         user_id = self.request.user.id
-        queryset = Recipe.objects.select_related('author').prefetch_related(
-            'tags', 'recipe_ingredients__ingredient'
-        )
+        queryset = Recipe.objects.filter(pending_deletion=False)
+        fields = FastDetailRecipeSerializer.all_field_names
+        if self.action in self.read_actions:
+            fields = get_requested_fields(self.request, fields)
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fields:
+            queryset = queryset.prefetch_related(
+                'recipe_ingredients__ingredient'
+            )
+        deferred = {'name', 'text', 'image', 'cooking_time'}.difference(fields)
+        if deferred:
+            queryset = queryset.defer(*deferred)
 
         if user_id:
             queryset = queryset.annotate(
-                is_favorited=Exists(
-                    self.request.user.favorites.filter(recipe=OuterRef('pk'))),
-                is_in_shopping_cart=Exists(
-                    self.request.user.carts.filter(recipe=OuterRef('pk')))
+                is_favorited=merge_pending(Favorite, user_id, Exists(
+                    self.request.user.favorites.filter(
+                        recipe=OuterRef('pk')))),
+                is_in_shopping_cart=merge_pending(
+                    ShoppingCart, user_id, Exists(
+                        self.request.user.shopping_carts.filter(
+                            recipe=OuterRef('pk'))))
             )
         else:
             queryset = queryset.annotate(
@@ -150,25 +230,141 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return queryset
 
     def get_serializer_class(self):
-        if self.action in ('retrieve', 'list'):
-            return DetailRecipeSerializer
+        if self.action in self.read_actions:
+            return FastDetailRecipeSerializer
         return SerializerRecipeCreateUpdate
 
+    def perform_create(self, serializer):
+        # Журнал изменений и задание ленты фиксируются вместе с рецептом
+        with transaction.atomic():
+            recipe = serializer.save()
+            log_recipe_change(recipe.id)
+            invalidate_facets()
+            enqueue_fan_out(recipe.id)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            recipe = serializer.save()
+            log_recipe_change(recipe.id)
+            invalidate_facets()
+
+    def perform_destroy(self, instance):
+        request_deletion(instance)
+
+    def list(self, request, *args, **kwargs):
+        params = RecipeFacetsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        response = super().list(request, *args, **kwargs)
+        if (params.validated_data['facets']
+                and SYNC_QUERY_PARAM not in request.query_params):
+            response.data['facets'] = self.get_facets()
+        return response
+
+    def get_facets(self):
+        # Набор фильтров уже проверен и применён в list()
+        return self.filterset.get_facets()
+
+    def get_recipes_data(self, recipe_ids):
+        """Рецепты по списку id в том же порядке, недоступные пропускаются."""
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes], many=True
+        ).data
+
+    def get_paginated_recipes(self, recipe_ids):
+        """Страница рецептов по упорядоченному списку id."""
+        recipe_ids = self.paginate_queryset(recipe_ids)
+        return self.get_paginated_response(self.get_recipes_data(recipe_ids))
+
+    @action(
+        methods=('get',),
+        detail=False,
+    )
+    def batch(self, request):
+        params = RecipeBatchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(self.get_recipes_data(params.validated_data['ids']))
+
+    @action(
+        methods=('get',),
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        return self.get_paginated_recipes(feed_recipe_ids(request.user))
+
+    @action(
+        methods=('get',),
+        detail=False,
+        url_path='by-ingredients'
+    )
+    def by_ingredients(self, request):
+        params = IngredientSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ingredient_ids = params.validated_data['ingredients']
+        mode = params.validated_data['mode']
+        ingredient_index.sync()
+        if mode == 'all':
+            recipe_ids = ingredient_index.contains_all(ingredient_ids)
+        elif mode == 'any':
+            recipe_ids = ingredient_index.contains_any(ingredient_ids)
+        else:
+            recipe_ids = ingredient_index.missing_at_most(
+                ingredient_ids, params.validated_data['max_missing']
+            )
+        return self.get_paginated_recipes(recipe_ids)
+
+    @action(
+        methods=('get',),
+        detail=True,
+    )
+    def similar(self, request, pk=None):
+        recipe = get_object_or_404(Recipe, id=pk, pending_deletion=False)
+        # Список пересчитывается периодически и может ссылаться на
+        # рецепты, скрытые после пересчёта
+        recipe_ids = SimilarRecipe.objects.filter(
+            recipe=recipe, similar__pending_deletion=False
+        ).order_by('-score').values_list('similar_id', flat=True)
+        return self.get_paginated_recipes(recipe_ids)
+
     def add_recipe_to(self, model, serializer_class, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
+        recipe = get_object_or_404(Recipe, id=pk, pending_deletion=False)
+        if settings.TOGGLE_WRITE_BEHIND:
+            if is_in_list(model, request.user.id, recipe.id):
+                raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                    serializer_class.Meta.validators[0].message
+                ]})
+            get_toggle_log().append(model, request.user.id, recipe.id, True)
+            serializer = serializer_class(
+                model(user=request.user, recipe=recipe),
+                context={'request': request},
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         data = {'user': request.user.id, 'recipe': recipe.id}
         serializer = serializer_class(
             data=data,
             context={'request': request},
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Строка и событие рейтинга фиксируются вместе, иначе
+        # update_ranking --full может учесть строку дважды
+        with transaction.atomic():
+            serializer.save()
+            record_activity(model, recipe.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def remove_recipe_from(self, model, request, pk, error_message):
-        recipe = get_object_or_404(Recipe, id=pk)
+        recipe = get_object_or_404(Recipe, id=pk, pending_deletion=False)
+        if settings.TOGGLE_WRITE_BEHIND:
+            if not is_in_list(model, request.user.id, recipe.id):
+                raise ValidationError(error_message)
+            get_toggle_log().append(model, request.user.id, recipe.id, False)
+            return Response(status=status.HTTP_204_NO_CONTENT)
         instance = model.objects.filter(recipe=recipe, user=request.user)
-        deleted, _ = instance.delete()
+        with transaction.atomic():
+            deleted, _ = instance.delete()
+            if deleted:
+                record_activity(model, recipe.id, added=False)
         if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         raise ValidationError(error_message)
@@ -216,6 +412,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
         short_link = request.build_absolute_uri(f'/s/{encoded_id}/')
         return Response({'short-link': short_link})
 
+    @staticmethod
+    def get_shopping_cart_ingredients(user):
+        in_cart = Q(recipe__shopping_carts__user=user)
+        added, removed = get_pending_ids(ShoppingCart, user.id)
+        if added or removed:
+            # Подзапрос вместо JOIN: OR с JOIN размножил бы строки
+            in_cart = Q(recipe_id__in=ShoppingCart.objects.filter(
+                user=user
+            ).exclude(recipe_id__in=removed).values('recipe_id')) | Q(
+                recipe_id__in=added)
+        return (
+            RecipeIngredient.objects.filter(
+                in_cart, recipe__pending_deletion=False
+            )
+            .values('ingredient__name', 'ingredient__measurement_unit')
+            .annotate(amount=Sum('amount'))
+            .order_by('ingredient__name')
+        )
+
     @action(
         methods=('get',),
         detail=False,
@@ -223,12 +438,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         user = request.user
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe__carts__user=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
+        ingredients = self.get_shopping_cart_ingredients(user)
 
         if not ingredients.exists():
             raise ValidationError('Список покупок пуст.')
@@ -246,3 +456,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'attachment; filename="shopping_list.txt"'
         )
         return response
+
+
+class LoadSheddingView(APIView):
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_shedding_stats())
+
+
+class ProfileReportView(APIView):
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, report_id):
+        try:
+            return Response(load_report(report_id))
+        except FileNotFoundError:
+            raise Http404
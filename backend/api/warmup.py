@@ -0,0 +1,64 @@
+"""Прогрев процесса до обработки первых запросов.
+
+Выполняется при загрузке WSGI-приложения (с gunicorn --preload - до
+fork, так что воркеры получают прогретое состояние) и командой
+warm_caches. Прогреваются только кэши, которые затем читают запросы:
+резолвер URL, фасеты каталога и индекс ингредиентов.
+"""
+import logging
+from time import perf_counter
+
+from django.core.cache import close_caches
+from django.db import connection, connections
+from django.urls import get_resolver
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Recipe
+from .filters import FilterRecipe
+
+logger = logging.getLogger(__name__)
+
+
+def warm_database():
+    connection.ensure_connection()
+
+
+def warm_urls():
+    resolver = get_resolver()
+    # Заполняет кэши reverse() и вложенных резолверов
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        getattr(pattern, 'reverse_dict', None)
+
+
+def warm_facets():
+    # Фасеты каталога без фильтров: тот же ключ кеша, что у запроса
+    # /api/recipes/?facets=true
+    filterset = FilterRecipe(
+        data={}, queryset=Recipe.objects.filter(pending_deletion=False))
+    filterset.is_valid()
+    filterset.get_facets()
+
+
+PHASES = [
+    ('database', warm_database),
+    ('urls', warm_urls),
+    ('facets', warm_facets),
+    ('ingredient_index', ingredient_index.sync),
+]
+
+
+def warm_up():
+    """Выполняет все фазы, возвращает время каждой в миллисекундах."""
+    timings = {}
+    try:
+        for name, phase in PHASES:
+            started = perf_counter()
+            phase()
+            timings[name] = (perf_counter() - started) * 1000
+    finally:
+        # Соединения с БД и кэшем (сокеты pymemcache, redis) нельзя
+        # наследовать воркерам после fork
+        connections.close_all()
+        close_caches()
+    return timings
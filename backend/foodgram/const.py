@@ -9,3 +9,72 @@ AMOUNT_MAX = 32000
 MAX_LENGTH_NAME_RECIPE = 256
 TIME_COOK_VALUE_MIN = 1
 TIME_COOK_VALUE_MAX = 32000
+STREAM_CHUNK_SIZE = 2000
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 200
+FEED_POLL_INTERVAL = 5
+RANKING_FAVORITE_WEIGHT = 2
+RANKING_CART_WEIGHT = 1
+RANKING_HALF_LIFE_WEEK = 7 * 24 * 60 * 60
+RANKING_HALF_LIFE_DAY = 24 * 60 * 60
+RANKING_REBASE_INTERVAL = 90 * 24 * 60 * 60
+RANKING_BATCH_SIZE = 5000
+RANKING_SEED_BATCH_SIZE = 10000
+RANKING_UPDATE_INTERVAL = 60
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+INGREDIENT_INDEX_REBUILD_INTERVAL = 60 * 60
+INGREDIENT_INDEX_MAX_CHANGES = 10000
+INGREDIENT_SEARCH_MAX_INGREDIENTS = 50
+RECIPE_CHANGES_RETENTION_DAYS = 7
+RECIPE_CHANGES_PRUNE_INTERVAL = 24 * 60 * 60
+# Дольше любой транзакции записи рецепта, с учётом расхождения часов
+RECIPE_CHANGES_LAG = 5 * 60
+SIMILAR_TOP_K = 20
+SIMILAR_BATCH_SIZE = 500
+SIMILAR_UPDATE_INTERVAL = 60 * 60
+SIMILAR_TAG_WEIGHT = 0.2
+SIMILAR_MAX_DF_RATIO = 0.3
+SIMILAR_MAX_DF_MIN = 1000
+EXPORT_CHUNK_SIZE = 2000
+MEDIA_SWEEP_GRACE_HOURS = 24
+MEDIA_SWEEP_INTERVAL = 24 * 60 * 60
+MEDIA_SWEEP_BATCH_SIZE = 1000
+CONCURRENCY_RETRY_AFTER = 1
+SUBSCRIPTION_RECIPES_PER_TOKEN = 10
+PARTITIONS_COUNT = 16
+PARTITION_COPY_BATCH_SIZE = 10000
+DELETION_BATCH_SIZE = 1000
+DELETION_POLL_INTERVAL = 10
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_REPORT_LINES = 50
+SYNC_QUERY_PARAM = 'updated_since'
+SYNC_PAGE_SIZE = 500
+# Дольше любой транзакции записи: более свежие изменения синхронизация
+# отдаёт позже, чтобы курсор не обогнал ещё не зафиксированные строки
+SYNC_LAG = 5 * 60
+RECIPE_BATCH_MAX_IDS = 100
+TOGGLE_FLUSH_INTERVAL = 1
+TOGGLE_ORPHAN_AGE = 60
+TOGGLE_PENDING_TIMEOUT = 24 * 60 * 60
+TOGGLE_PENDING_LOCK_TIMEOUT = 5
+TOGGLE_PENDING_LOCK_WAIT = 0.01
+ANALYTICS_BATCH_SIZE = 10000
+ANALYTICS_DAYS = 30
+ANALYTICS_TOP = 10
+# Дольше любой транзакции, вставляющей строки источников аналитики
+ANALYTICS_LAG = 5 * 60
+# Размер части строки base64 при декодировании картинки во временный файл
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+S3_MAX_POOL_CONNECTIONS = 20
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+RECIPE_FACETS_CACHE_TIMEOUT = 600
+# (метка, верхняя граница в минутах); последний интервал без границы
+RECIPE_FACETS_COOKING_TIME_BUCKETS = (
+    ('0-15', 15),
+    ('16-30', 30),
+    ('31-60', 60),
+    ('61+', None),
+)
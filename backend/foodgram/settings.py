@@ -34,6 +34,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 
@@ -105,6 +106,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Хранилище изображений: filesystem - MEDIA_ROOT на локальном томе,
+# s3 - общий S3-совместимый бакет (AWS, MinIO) для нескольких узлов
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'filesystem')
+if MEDIA_STORAGE == 's3':
+    DEFAULT_FILE_STORAGE = 'foodgram.storage.MediaStorage'
+    AWS_STORAGE_BUCKET_NAME = os.getenv('S3_BUCKET', 'foodgram')
+    AWS_S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    AWS_S3_REGION_NAME = os.getenv('S3_REGION')
+    AWS_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY')
+    AWS_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_KEY')
+    # Домен публичных ссылок, например CDN или адрес MinIO
+    AWS_S3_CUSTOM_DOMAIN = os.getenv('S3_CUSTOM_DOMAIN')
+    AWS_S3_URL_PROTOCOL = os.getenv('S3_URL_PROTOCOL', 'https:')
+    AWS_QUERYSTRING_AUTH = (
+        os.getenv('S3_QUERYSTRING_AUTH', 'False').lower() == 'true'
+    )
+    AWS_S3_FILE_OVERWRITE = False
+    S3_ADDRESSING_STYLE = os.getenv('S3_ADDRESSING_STYLE', 'auto')
+
+# Отчёты профилировщика запросов (api.profiling)
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -116,8 +139,53 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginations.PageSizePagination',
     'PAGE_SIZE': 12,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '10/m'),
+        'subscriptions': os.getenv('THROTTLE_SUBSCRIPTIONS', '60/m'),
+        'uploads': os.getenv('THROTTLE_UPLOADS', '20/m'),
+        'catalog': os.getenv('THROTTLE_CATALOG', '30/m'),
+    },
+}
+
+# Одновременных запросов на scope в одном процессе. Счётчик локален для
+# процесса: общий предел - значение, умноженное на число процессов
+# gunicorn (WEB_CONCURRENCY), и он срабатывает, только пока значение
+# меньше числа потоков воркера (--threads в Dockerfile)
+CONCURRENCY_LIMITS = {
+    'shopping_cart': 2,
+    'subscriptions': 4,
+    'uploads': 4,
+    'catalog': 2,
 }
 
+# Троттлинг хранит состояние в кэше, для нескольких процессов кэш должен
+# быть общим, например CACHE_BACKEND=
+# django.core.cache.backends.memcached.PyMemcacheCache
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Задания лент выполняет process_feed_jobs; False — сразу после фиксации
+# транзакции в процессе запроса (разработка, тесты)
+FEED_FANOUT_ASYNC = os.getenv('FEED_FANOUT_ASYNC', 'True').lower() == 'true'
+
+# Отложенная запись избранного и корзины (recipes.write_behind). Чтения
+# объединяют ожидающие изменения через кэш, поэтому он должен быть общим
+TOGGLE_WRITE_BEHIND = (
+    os.getenv('TOGGLE_WRITE_BEHIND', 'False').lower() == 'true'
+)
+TOGGLE_LOG_DIR = os.getenv(
+    'TOGGLE_LOG_DIR', os.path.join(BASE_DIR, 'toggle_log')
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
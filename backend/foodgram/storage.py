@@ -0,0 +1,30 @@
+"""S3-совместимое хранилище медиафайлов (MEDIA_STORAGE=s3).
+
+Изображения рецептов и аватары хранятся в общем бакете, поэтому
+несколько узлов backend могут работать без общего тома media.
+Подходит и AWS S3, и MinIO (S3_ENDPOINT_URL).
+"""
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from django.conf import settings
+from storages.backends.s3 import S3Storage
+
+from foodgram.const import (
+    S3_MAX_POOL_CONNECTIONS,
+    S3_MULTIPART_CHUNK_SIZE,
+    S3_MULTIPART_THRESHOLD,
+)
+
+
+class MediaStorage(S3Storage):
+    # Клиент создаётся один на поток и держит пул соединений
+    config = Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={'mode': 'standard'},
+        s3={'addressing_style': settings.S3_ADDRESSING_STYLE},
+    )
+    # Крупные файлы загружаются частями из файла, без чтения в память
+    transfer_config = TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+    )
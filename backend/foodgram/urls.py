@@ -13,7 +13,7 @@ def short_link_redirect(request, encoded_id):
     try:
         decoded_id = force_str(urlsafe_base64_decode(encoded_id))
         recipe_id = int(decoded_id)
-        get_object_or_404(Recipe, id=recipe_id)
+        get_object_or_404(Recipe, id=recipe_id, pending_deletion=False)
         return HttpResponseRedirect(f'/recipes/{recipe_id}/')
     except (ValueError, TypeError):
         return HttpResponse(status=404)
@@ -7,10 +7,29 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
+from time import perf_counter
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
+started = perf_counter()
 application = get_wsgi_application()
+setup_time = (perf_counter() - started) * 1000
+
+if os.getenv('WARM_UP', 'True').lower() == 'true':
+    from api.warmup import warm_up
+
+    logger = logging.getLogger('api.warmup')
+    try:
+        timings = warm_up()
+    except Exception:
+        # Недоступная БД не должна мешать запуску, воркеры прогреются сами
+        logger.exception('Прогрев не выполнен')
+    else:
+        timings = {'django_setup': setup_time, **timings}
+        logger.warning('Прогрев, мс: %s', ', '.join(
+            f'{name}={elapsed:.1f}' for name, elapsed in timings.items()
+        ))
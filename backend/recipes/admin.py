@@ -1,79 +1,175 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.db.models import Count, IntegerField, OuterRef, Subquery
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
 from django.utils.html import format_html
 
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Subscribe, Tag)
+from foodgram.const import ANALYTICS_DAYS
+from .analytics import get_dashboard
+from .deletion import record_tombstones, request_deletion, touch_recipes
+from .facets import invalidate_facets
+from .models import (DailyRollup, Favorite, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, Subscribe, Tag)
+from .paginators import EstimatedCountPaginator
 
 User = get_user_model()
 
 
+def count_subquery(queryset, field):
+    """Количество связанных строк коррелированным подзапросом: считается
+    только для строк текущей страницы, а не GROUP BY по всей таблице."""
+    return Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count'),
+        output_field=IntegerField(),
+    )
+
+
+class ScaleModeAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DeferredDeletionAdmin(admin.ModelAdmin):
+    """Удаление ставится в фоновое задание (process_deletions), а не
+    выполняется каскадом в одной транзакции запроса."""
+
+    def get_deleted_objects(self, objs, request):
+        # Без сбора всех каскадных связей для страницы подтверждения
+        objs = list(objs)
+        model_count = {self.model._meta.verbose_name_plural: len(objs)}
+        return [str(obj) for obj in objs], model_count, set(), []
+
+    def delete_model(self, request, obj):
+        request_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            request_deletion(obj)
+
+
+class TombstoneAdmin(admin.ModelAdmin):
+    """Записывает удаления справочников для синхронизации клиентов.
+
+    recipe_lookup подкласса - путь от рецепта к объекту справочника:
+    рецепты, связанные с удаляемыми объектами, отмечаются изменёнными.
+    """
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            record_tombstones(self.model, [obj.pk])
+            touch_recipes(**{self.recipe_lookup: [obj.pk]})
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            object_ids = list(queryset.values_list('pk', flat=True))
+            record_tombstones(self.model, object_ids)
+            touch_recipes(**{self.recipe_lookup: object_ids})
+            super().delete_queryset(request, queryset)
+
+
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(DeferredDeletionAdmin, ScaleModeAdmin, BaseUserAdmin):
     list_display = ('id', 'email', 'username', 'get_recipes_count',
                     'get_subscribers_count')
-    list_filter = ('email', 'username', 'last_name', 'first_name')
+    list_filter = ('is_staff', 'is_superuser', 'is_active',
+                   'pending_deletion')
     list_display_links = ('username',)
     search_fields = ('email', 'username')
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
         queryset = queryset.annotate(
-            recipes_count=Count('recipe', distinct=True),
-            subscribers_count=Count('subscribing', distinct=True)
+            recipes_count=count_subquery(Recipe.objects, 'author'),
+            subscribers_count=count_subquery(Subscribe.objects, 'author')
         )
         return queryset
 
     def get_recipes_count(self, obj):
-        return obj.recipes_count
+        return obj.recipes_count or 0
     get_recipes_count.short_description = 'Рецептов'
     get_recipes_count.admin_order_field = 'recipes_count'
 
     def get_subscribers_count(self, obj):
-        return obj.subscribers_count
+        return obj.subscribers_count or 0
     get_subscribers_count.short_description = 'Подписчиков'
     get_subscribers_count.admin_order_field = 'subscribers_count'
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(TombstoneAdmin):
+    recipe_lookup = 'tags__in'
     list_display = ('name', 'slug', 'id')
     list_display_links = ('name',)
     search_fields = ('name', 'slug')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_facets()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_facets()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_facets()
+
 
 @admin.register(Subscribe)
-class SubscribeAdmin(admin.ModelAdmin):
+class SubscribeAdmin(ScaleModeAdmin):
     list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
     search_fields = ('author__username', 'user__username')
-    list_filter = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
-    list_filter = ('name',)
+class IngredientAdmin(TombstoneAdmin, ScaleModeAdmin):
+    recipe_lookup = 'recipe_ingredients__ingredient__in'
+    list_filter = ('measurement_unit',)
     list_display_links = ('name',)
     list_display = ('id', 'name', 'measurement_unit')
     search_fields = ('name',)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_filter = ('name', 'tags', 'author')
+class RecipeAdmin(DeferredDeletionAdmin, ScaleModeAdmin):
+    list_filter = ('tags', 'pending_deletion')
     list_display_links = ('name',)
     list_display = ('id', 'favorites_count', 'name', 'author', 'get_image')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__email', 'author__username')
+    autocomplete_fields = ('author',)
     inlines = (RecipeIngredientInline,)
 
-    @admin.display(description='Добавления в избранное')
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        invalidate_facets()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            favorites_count=count_subquery(Favorite.objects, 'recipe')
+        )
+
+    @admin.display(
+        description='Добавления в избранное',
+        ordering='favorites_count',
+    )
     def favorites_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count or 0
 
     @admin.display(description='Изображение')
     def get_image(self, obj):
@@ -85,12 +181,47 @@ class RecipeAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ScaleModeAdmin):
     list_display = ('id', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
     search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScaleModeAdmin):
     list_display = ('id', 'recipe', 'user')
+    list_select_related = ('recipe', 'user')
     search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
+
+
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    """Дашборд аналитики по агрегатам update_analytics."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = max(int(request.GET.get('days', ANALYTICS_DAYS)), 1)
+        except ValueError:
+            days = ANALYTICS_DAYS
+        return TemplateResponse(
+            request, 'admin/recipes/dailyrollup/dashboard.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'title': 'Аналитика',
+                'days': days,
+                **get_dashboard(days),
+            }
+        )
@@ -0,0 +1,196 @@
+"""Дневные агрегаты для аналитики в админке.
+
+Каждый источник обрабатывается диапазонами id после своей отметки в
+Watermark. Агрегаты диапазона прибавляются к DailyRollup в той же
+транзакции, что и сдвиг отметки, поэтому диапазон не учитывается
+дважды. id выдаётся при вставке, а транзакции фиксируются в другом
+порядке, поэтому отметка не обгоняет id, замеченные раньше
+ANALYTICS_LAG: строка из транзакции длиннее этого срока будет
+пропущена. Дашборд читает только DailyRollup.
+
+Считаются добавления: ингредиенты и теги учитываются один раз при
+появлении рецепта, последующие правки и удаления агрегаты не меняют.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from foodgram.const import ANALYTICS_BATCH_SIZE, ANALYTICS_LAG, ANALYTICS_TOP
+from .models import (DailyRollup, Favorite, Recipe, RecipeIngredient,
+                     Subscribe, Watermark)
+
+User = get_user_model()
+
+
+def rollup_recipes(first_id, last_id):
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id__gt=first_id, recipe_id__lte=last_id
+    ).values(
+        'ingredient_id', 'ingredient__name', 'ingredient__measurement_unit',
+        day=TruncDate('recipe__created_at'),
+    ).annotate(value=Count('id')).order_by()
+    tags = Recipe.tags.through.objects.filter(
+        recipe_id__gt=first_id, recipe_id__lte=last_id
+    ).values(
+        'tag_id', 'tag__name', day=TruncDate('recipe__created_at'),
+    ).annotate(value=Count('id')).order_by()
+    return [
+        (DailyRollup.INGREDIENTS, row['day'], row['ingredient_id'],
+         f'{row["ingredient__name"]} '
+         f'({row["ingredient__measurement_unit"]})', row['value'])
+        for row in ingredients
+    ] + [
+        (DailyRollup.TAGS, row['day'], row['tag_id'], row['tag__name'],
+         row['value'])
+        for row in tags
+    ]
+
+
+def rollup_users(first_id, last_id):
+    return [
+        (DailyRollup.SIGNUPS, row['day'], 0, '', row['value'])
+        for row in User.objects.filter(
+            id__gt=first_id, id__lte=last_id
+        ).values(day=TruncDate('date_joined')).annotate(
+            value=Count('id')
+        ).order_by()
+    ]
+
+
+def rollup_subscriptions(first_id, last_id):
+    # У подписок нет времени создания: днём считается день обработки
+    today = timezone.localdate()
+    return [
+        (DailyRollup.FOLLOWERS, today, row['author_id'],
+         row['author__username'], row['value'])
+        for row in Subscribe.objects.filter(
+            id__gt=first_id, id__lte=last_id
+        ).values('author_id', 'author__username').annotate(
+            value=Count('id')
+        ).order_by()
+    ]
+
+
+def rollup_favorites(first_id, last_id):
+    today = timezone.localdate()
+    return [
+        (DailyRollup.FAVORITES, today, row['recipe_id'],
+         row['recipe__name'], row['value'])
+        for row in Favorite.objects.filter(
+            id__gt=first_id, id__lte=last_id
+        ).values('recipe_id', 'recipe__name').annotate(
+            value=Count('id')
+        ).order_by()
+    ]
+
+
+SOURCES = {
+    'recipes': (Recipe, rollup_recipes),
+    'users': (User, rollup_users),
+    'subscriptions': (Subscribe, rollup_subscriptions),
+    'favorites': (Favorite, rollup_favorites),
+}
+
+
+def add_rows(rows):
+    """Прибавляет строки (metric, day, object_id, label, value)."""
+    totals = {}
+    for metric, day, object_id, label, value in rows:
+        total = totals.setdefault((metric, day, object_id), [label, 0])
+        total[1] += value
+    if not totals:
+        return
+    existing = {
+        (rollup.metric, rollup.day, rollup.object_id): rollup
+        for rollup in DailyRollup.objects.filter(
+            metric__in={key[0] for key in totals},
+            day__in={key[1] for key in totals},
+            object_id__in={key[2] for key in totals},
+        )
+    }
+    new_rollups = []
+    for (metric, day, object_id), (label, value) in totals.items():
+        rollup = existing.get((metric, day, object_id))
+        if rollup is None:
+            new_rollups.append(DailyRollup(
+                metric=metric, day=day, object_id=object_id,
+                label=label, value=value,
+            ))
+            continue
+        rollup.label = label
+        rollup.value += value
+    DailyRollup.objects.bulk_update(existing.values(), ('label', 'value'))
+    DailyRollup.objects.bulk_create(new_rollups)
+
+
+def get_settled_id(name, model):
+    """Наибольший id, до которого строки источника уже зафиксированы.
+
+    Это максимум id, замеченный не меньше ANALYTICS_LAG назад: вставившие
+    такие строки транзакции к этому времени завершены. Замер обновляется
+    не чаще раза в ANALYTICS_LAG, поэтому новая строка попадает в агрегаты
+    через один-два таких срока (или интервала запуска, если он больше).
+    """
+    with transaction.atomic():
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        seen, created = Watermark.objects.select_for_update().get_or_create(
+            name=f'analytics_{name}_seen', defaults={'value': last_id}
+        )
+        if created or seen.updated_at > timezone.now() - timedelta(
+                seconds=ANALYTICS_LAG):
+            return None
+        settled_id = seen.value
+        seen.value = last_id
+        seen.save(update_fields=('value', 'updated_at'))
+    return settled_id
+
+
+def update_source(name, batch_size=ANALYTICS_BATCH_SIZE):
+    """Обрабатывает новые строки источника, возвращает число диапазонов."""
+    model, rollup = SOURCES[name]
+    last_id = get_settled_id(name, model)
+    if last_id is None:
+        return 0
+    batches = 0
+    while True:
+        with transaction.atomic():
+            # Блокировка отметки не даёт двум пересчётам работать вместе
+            watermark, _ = Watermark.objects.select_for_update(
+            ).get_or_create(name=f'analytics_{name}')
+            if watermark.value >= last_id:
+                return batches
+            batch_end = min(watermark.value + batch_size, last_id)
+            add_rows(rollup(watermark.value, batch_end))
+            watermark.value = batch_end
+            watermark.save(update_fields=('value', 'updated_at'))
+        batches += 1
+
+
+def update_analytics(batch_size=ANALYTICS_BATCH_SIZE):
+    return {name: update_source(name, batch_size) for name in SOURCES}
+
+
+def get_dashboard(days):
+    """Данные дашборда за последние days дней только из DailyRollup."""
+    rollups = DailyRollup.objects.filter(
+        day__gte=timezone.localdate() - timedelta(days=days - 1)
+    )
+    top = []
+    for metric, title in DailyRollup.METRICS:
+        if metric == DailyRollup.SIGNUPS:
+            continue
+        top.append((title, list(
+            rollups.filter(metric=metric)
+            .values('object_id')
+            .annotate(name=Max('label'), total=Sum('value'))
+            .order_by('-total')[:ANALYTICS_TOP]
+        )))
+    signups = list(
+        rollups.filter(metric=DailyRollup.SIGNUPS)
+        .order_by('day').values_list('day', 'value')
+    )
+    return {'top': top, 'signups': signups}
@@ -0,0 +1,182 @@
+"""Фоновое удаление пользователей и рецептов порциями.
+
+Объект сразу помечается pending_deletion и скрывается из API, а
+зависимые строки удаляются небольшими транзакциями. Этап и счётчик
+задания фиксируются вместе с каждой порцией, поэтому после сбоя
+удаление продолжается с того же этапа.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from foodgram.const import DELETION_BATCH_SIZE
+from .facets import invalidate_facets
+from .ingredient_index import log_recipe_changes
+from .models import (DeletionJob, Favorite, FeedEntry, Recipe,
+                     RecipeActivity, RecipeChange, RecipeIngredient,
+                     RecipeScore, ShoppingCart, SimilarRecipe, Subscribe,
+                     Tombstone)
+from .ranking import EVENT_WEIGHTS, record_activity_batch
+
+User = get_user_model()
+
+DONE = 'done'
+
+
+def record_tombstones(model, object_ids):
+    """Сообщает клиентам синхронизации об удалении объектов."""
+    Tombstone.objects.bulk_create([
+        Tombstone(model=model._meta.model_name, object_id=object_id)
+        for object_id in object_ids
+    ])
+
+
+def touch_recipes(**lookup):
+    """Отмечает изменёнными рецепты, которые теряют связь с удаляемым
+    тегом или ингредиентом: каскад не меняет updated_at, и клиенты
+    синхронизации не узнали бы об изменении."""
+    recipe_ids = list(
+        Recipe.objects.filter(**lookup).order_by()
+        .values_list('id', flat=True).distinct()
+    )
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        updated_at=timezone.now()
+    )
+    log_recipe_changes(recipe_ids)
+
+
+def hide_author_recipes(author_id):
+    """Помечает рецепты автора, пишет их надгробия и записи журнала
+    изменений одним запросом, не выгружая id рецептов в процесс."""
+    quote = connection.ops.quote_name
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH hidden AS (UPDATE {quote(Recipe._meta.db_table)} '
+            'SET "pending_deletion" = true '
+            'WHERE "author_id" = %s AND NOT "pending_deletion" '
+            'RETURNING "id"), '
+            f'tombstones AS (INSERT INTO {quote(Tombstone._meta.db_table)} '
+            '("model", "object_id", "deleted_at") '
+            'SELECT %s, "id", %s FROM hidden) '
+            f'INSERT INTO {quote(RecipeChange._meta.db_table)} '
+            '("recipe_id", "created") '
+            'SELECT "id", %s FROM hidden',
+            [author_id, Recipe._meta.model_name, now, now],
+        )
+
+
+def request_deletion(obj):
+    """Скрывает объект и ставит задание на его удаление."""
+    with transaction.atomic():
+        if isinstance(obj, User):
+            target = DeletionJob.USER
+            User.objects.filter(pk=obj.pk).update(
+                pending_deletion=True, is_active=False
+            )
+            # Рецепты автора скрываются сразу, удаляются вместе с ним
+            hide_author_recipes(obj.pk)
+        else:
+            target = DeletionJob.RECIPE
+            Recipe.objects.filter(pk=obj.pk).update(pending_deletion=True)
+            # Индекс ингредиентов уберёт скрытый рецепт при синхронизации
+            log_recipe_changes([obj.pk])
+        record_tombstones(type(obj), [obj.pk])
+        invalidate_facets()
+        job, _ = DeletionJob.objects.get_or_create(
+            target=target, object_id=obj.pk
+        )
+    return job
+
+
+def get_recipe_stages(recipe_ids):
+    return [
+        ('favorites', Favorite.objects.filter(recipe_id__in=recipe_ids)),
+        ('shopping_carts',
+         ShoppingCart.objects.filter(recipe_id__in=recipe_ids)),
+        ('ingredients',
+         RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)),
+        ('tags', Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids)),
+        ('feed', FeedEntry.objects.filter(recipe_id__in=recipe_ids)),
+        ('activities',
+         RecipeActivity.objects.filter(recipe_id__in=recipe_ids)),
+        ('similar', SimilarRecipe.objects.filter(
+            Q(recipe_id__in=recipe_ids) | Q(similar_id__in=recipe_ids))),
+        ('score', RecipeScore.objects.filter(recipe_id__in=recipe_ids)),
+        ('recipes', Recipe.objects.filter(id__in=recipe_ids)),
+    ]
+
+
+def get_stages(job):
+    """Этапы задания: пары (название, queryset удаляемых строк)."""
+    if job.target == DeletionJob.RECIPE:
+        return get_recipe_stages([job.object_id])
+    user_id = job.object_id
+    return get_recipe_stages(
+        Recipe.objects.filter(author_id=user_id).values('id')
+    ) + [
+        ('own_favorites', Favorite.objects.filter(user_id=user_id)),
+        ('own_shopping_carts',
+         ShoppingCart.objects.filter(user_id=user_id)),
+        ('own_feed', FeedEntry.objects.filter(
+            Q(user_id=user_id) | Q(author_id=user_id))),
+        ('subscriptions', Subscribe.objects.filter(
+            Q(user_id=user_id) | Q(author_id=user_id))),
+        ('user', User.objects.filter(id=user_id)),
+    ]
+
+
+def delete_batch(job, queryset, batch_size):
+    """Удаляет одну порцию строк этапа и сохраняет прогресс задания.
+
+    Возвращает число выбранных строк: 0 означает конец этапа.
+    """
+    model = queryset.model
+    ids = list(
+        queryset.order_by().values_list('pk', flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0
+    with transaction.atomic():
+        if model in EVENT_WEIGHTS:
+            # Рейтинг уменьшается так же, как при удалении из списка;
+            # блокировка не даёт параллельному удалению учесть строку
+            # второй раз
+            record_activity_batch(model, [], list(
+                model.objects.select_for_update().filter(pk__in=ids)
+                .values_list('recipe_id', flat=True)
+            ))
+        deleted, _ = model.objects.filter(pk__in=ids).delete()
+        if model is Recipe:
+            log_recipe_changes(ids)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            stage=job.stage, deleted=F('deleted') + deleted
+        )
+    job.deleted += deleted
+    return len(ids)
+
+
+def process_job(job, batch_size=DELETION_BATCH_SIZE, on_batch=None):
+    stages = get_stages(job)
+    names = [name for name, _ in stages]
+    start = names.index(job.stage) if job.stage in names else 0
+    for name, queryset in stages[start:]:
+        job.stage = name
+        job.save(update_fields=('stage', 'updated_at'))
+        while delete_batch(job, queryset, batch_size):
+            if on_batch:
+                on_batch(job)
+    job.stage = DONE
+    job.save(update_fields=('stage', 'updated_at'))
+
+
+def process_pending(batch_size=DELETION_BATCH_SIZE, on_batch=None):
+    """Выполняет все незавершённые задания, включая прерванные."""
+    jobs = DeletionJob.objects.exclude(stage=DONE)
+    processed = 0
+    for job in jobs:
+        process_job(job, batch_size, on_batch)
+        processed += 1
+    return processed
@@ -0,0 +1,95 @@
+"""Фасеты списка рецептов: число рецептов по тегам и по времени
+приготовления для текущих фильтров.
+
+Оба фасета считаются одним запросом (UNION ALL двух GROUP BY) и кешируются
+по нормализованному ключу фильтров. Любая запись рецепта меняет версию
+фасетов, и все закешированные значения сразу устаревают.
+"""
+import hashlib
+import json
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Value, When
+
+from foodgram.const import (RECIPE_FACETS_CACHE_TIMEOUT,
+                            RECIPE_FACETS_COOKING_TIME_BUCKETS)
+from .models import Recipe
+
+VERSION_KEY = 'recipe_facets:version'
+
+
+def invalidate_facets():
+    # После фиксации: иначе параллельный запрос успеет закешировать
+    # фасеты по ещё старым данным
+    transaction.on_commit(
+        lambda: cache.set(VERSION_KEY, uuid4().hex, None)
+    )
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен: новая версия не совпадёт со старыми значениями
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_cache_key(params):
+    digest = hashlib.sha1(
+        json.dumps(params, sort_keys=True).encode()
+    ).hexdigest()
+    return f'recipe_facets:{get_version()}:{digest}'
+
+
+def get_cooking_time_bucket():
+    *bounded, (last_label, _) = RECIPE_FACETS_COOKING_TIME_BUCKETS
+    return Case(
+        *(
+            When(cooking_time__lte=upper, then=Value(label))
+            for label, upper in bounded
+        ),
+        default=Value(last_label),
+        output_field=CharField(),
+    )
+
+
+def count_facets(recipes, tagged_recipes):
+    """recipes — выборка для фасета времени, tagged_recipes — для фасета
+    тегов (без фильтра по самим тегам)."""
+    by_tag = Recipe.tags.through.objects.filter(
+        recipe_id__in=tagged_recipes.order_by().values('pk')
+    ).order_by().annotate(
+        facet=Value('tags', output_field=CharField()),
+        key=F('tag__slug'),
+    ).values('facet', 'key').annotate(count=Count('pk'))
+    by_time = Recipe.objects.filter(
+        pk__in=recipes.order_by().values('pk')
+    ).order_by().annotate(
+        facet=Value('cooking_time', output_field=CharField()),
+        key=get_cooking_time_bucket(),
+    ).values('facet', 'key').annotate(count=Count('pk'))
+    facets = {
+        'tags': {},
+        'cooking_time': dict.fromkeys(
+            (label for label, _ in RECIPE_FACETS_COOKING_TIME_BUCKETS), 0
+        ),
+    }
+    for row in by_tag.union(by_time, all=True):
+        facets[row['facet']][row['key']] = row['count']
+    return facets
+
+
+def get_facets(params, recipes, tagged_recipes):
+    """Фасеты для фильтров params; без params (личные списки
+    пользователя) значение не кешируется."""
+    if params is None:
+        return count_facets(recipes, tagged_recipes)
+    key = get_cache_key(params)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(recipes, tagged_recipes)
+        cache.set(key, facets, RECIPE_FACETS_CACHE_TIMEOUT)
+    return facets
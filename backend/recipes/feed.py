@@ -0,0 +1,178 @@
+"""Лента рецептов подписок: fan-out при публикации рецепта.
+
+Запись в ленты ставится заданием FeedJob в той же транзакции, что и
+рецепт или подписка, поэтому не теряется при перезапуске процесса.
+Задания выполняет process_feed_jobs. Повторное выполнение безопасно:
+записи вставляются с ignore_conflicts.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from foodgram.const import (
+    FEED_BACKFILL_LIMIT,
+    FEED_FANOUT_BATCH_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
+)
+from .models import FanInAuthor, FeedEntry, FeedJob, Recipe, Subscribe
+
+
+def enqueue(kind, **ids):
+    job = FeedJob.objects.create(kind=kind, **ids)
+    if not settings.FEED_FANOUT_ASYNC:
+        transaction.on_commit(lambda: process_job(job))
+    return job
+
+
+def enqueue_fan_out(recipe_id):
+    return enqueue(FeedJob.FAN_OUT, recipe_id=recipe_id)
+
+
+def enqueue_backfill(user_id, author_id):
+    return enqueue(FeedJob.BACKFILL, user_id=user_id, author_id=author_id)
+
+
+def is_fan_in_author(author_id):
+    """Для авторов с огромным числом подписчиков лента собирается при
+    чтении, а не записывается каждому подписчику."""
+    return FanInAuthor.objects.filter(author_id=author_id).exists()
+
+
+def refresh_fan_in_authors():
+    """Добавляет авторов, у которых подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS.
+
+    Автор из списка не удаляется: его рецепты, опубликованные до этого,
+    не разосланы подписчикам и попадают в ленту только при чтении.
+    """
+    authors = Subscribe.objects.order_by().values('author_id').annotate(
+        followers=Count('id')
+    ).filter(followers__gt=FEED_FANOUT_MAX_FOLLOWERS)
+    FanInAuthor.objects.bulk_create(
+        (FanInAuthor(**author) for author in authors),
+        batch_size=FEED_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(authors)
+
+
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.filter(
+        id=recipe_id, pending_deletion=False
+    ).only('author_id').first()
+    if recipe is None or is_fan_in_author(recipe.author_id):
+        return
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            # Строки подписок заблокированы до вставки: отписка дождётся
+            # её и очистит ленту уже после
+            subscriptions = list(
+                Subscribe.objects.select_for_update().filter(
+                    author_id=recipe.author_id, id__gt=last_id
+                ).order_by('id').values_list(
+                    'id', 'user_id'
+                )[:FEED_FANOUT_BATCH_SIZE]
+            )
+            FeedEntry.objects.bulk_create(
+                (
+                    FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                              author_id=recipe.author_id)
+                    for _, user_id in subscriptions
+                ),
+                ignore_conflicts=True,
+            )
+        if len(subscriptions) < FEED_FANOUT_BATCH_SIZE:
+            return
+        last_id = subscriptions[-1][0]
+
+
+def backfill_subscription(user_id, author_id):
+    if is_fan_in_author(author_id):
+        return
+    with transaction.atomic():
+        # Задание могло выполниться после отписки
+        subscription = Subscribe.objects.select_for_update().filter(
+            user_id=user_id, author_id=author_id
+        ).only('id').first()
+        if subscription is None:
+            return
+        recipe_ids = Recipe.objects.filter(
+            author_id=author_id, pending_deletion=False
+        ).order_by('-id').values_list('id', flat=True)[:FEED_BACKFILL_LIMIT]
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                          author_id=author_id)
+                for recipe_id in recipe_ids
+            ),
+            batch_size=FEED_FANOUT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def remove_subscription(user_id, author_id):
+    """Удаляет подписку и её записи ленты одной транзакцией: задания
+    ленты, ждущие блокировки подписки, после неё её уже не найдут."""
+    with transaction.atomic():
+        deleted, _ = Subscribe.objects.filter(
+            user_id=user_id, author_id=author_id
+        ).delete()
+        if deleted:
+            FeedEntry.objects.filter(
+                user_id=user_id, author_id=author_id
+            ).delete()
+    return bool(deleted)
+
+
+JOB_HANDLERS = {
+    FeedJob.FAN_OUT: lambda job: fan_out_recipe(job.recipe_id),
+    FeedJob.BACKFILL: lambda job: backfill_subscription(
+        job.user_id, job.author_id),
+}
+
+
+def process_job(job):
+    JOB_HANDLERS[job.kind](job)
+    FeedJob.objects.filter(pk=job.pk).delete()
+
+
+def process_pending():
+    """Выполняет накопившиеся задания в порядке постановки."""
+    processed = 0
+    last_id = 0
+    while True:
+        jobs = list(
+            FeedJob.objects.filter(id__gt=last_id)[:FEED_FANOUT_BATCH_SIZE]
+        )
+        for job in jobs:
+            process_job(job)
+        processed += len(jobs)
+        if len(jobs) < FEED_FANOUT_BATCH_SIZE:
+            return processed
+        last_id = jobs[-1].id
+
+
+def feed_recipe_ids(user):
+    """id рецептов ленты по убыванию: записи ленты плюс рецепты
+    fan-in авторов, на которых подписан пользователь.
+
+    Рецепты, ожидающие удаления, отбрасываются здесь, а не при выдаче
+    страницы: иначе они попадают в count и страницы приходят неполными.
+    """
+    recipe_ids = FeedEntry.objects.filter(
+        user=user, recipe__pending_deletion=False
+    ).values_list('recipe_id', flat=True)
+    fan_in_authors = list(
+        Subscribe.objects.filter(
+            user=user,
+            author_id__in=FanInAuthor.objects.values('author_id'),
+        ).values_list('author_id', flat=True)
+    )
+    if fan_in_authors:
+        recipe_ids = recipe_ids.order_by().union(
+            Recipe.objects.filter(
+                author_id__in=fan_in_authors, pending_deletion=False
+            ).order_by().values_list('id', flat=True)
+        )
+    return recipe_ids.order_by('-recipe_id')
@@ -0,0 +1,234 @@
+"""Инвертированный индекс ингредиент -> рецепты в памяти процесса.
+
+Для каждого ингредиента хранится отсортированный array id рецептов.
+Индекс строится при прогреве (или при первом обращении), затем
+догоняет журнал RecipeChange и раз в INGREDIENT_INDEX_REBUILD_INTERVAL
+перестраивается целиком в фоне (подхватывает правки из админки); до
+конца перестройки запросы обслуживает прежний индекс.
+"""
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+from time import monotonic
+
+from django.db import connection
+from django.utils import timezone
+
+from foodgram.const import (
+    INGREDIENT_INDEX_MAX_CHANGES,
+    INGREDIENT_INDEX_REBUILD_INTERVAL,
+    RECIPE_CHANGES_LAG,
+    STREAM_CHUNK_SIZE,
+)
+from .models import RecipeChange, RecipeIngredient
+
+
+def log_recipe_change(recipe_id):
+    RecipeChange.objects.create(recipe_id=recipe_id)
+
+
+def log_recipe_changes(recipe_ids):
+    RecipeChange.objects.bulk_create(
+        RecipeChange(recipe_id=recipe_id) for recipe_id in recipe_ids
+    )
+
+
+def get_changes_window(since):
+    """Записи журнала начиная с since - RECIPE_CHANGES_LAG.
+
+    id записи выдаётся при вставке, а транзакции фиксируются в другом
+    порядке, поэтому отметка по id пропускает поздно зафиксированные
+    записи. Окно по времени перечитывает их, потребители применяют
+    изменения повторно без вреда.
+    """
+    return RecipeChange.objects.filter(
+        created__gte=since - timedelta(seconds=RECIPE_CHANGES_LAG)
+    )
+
+
+class IngredientIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.recipe_ingredients = {}
+        # id применённых записей журнала из окна перечитывания
+        self.applied_changes = {}
+        self.synced_at = None
+        self.built_at = None
+        self.rebuilding = False
+
+    def load(self, recipe_ids=None):
+        # Рецепты, ожидающие удаления, выпадают из индекса сразу: их
+        # скрытие записывается в журнал изменений
+        rows = RecipeIngredient.objects.filter(
+            recipe__pending_deletion=False
+        ).order_by().values_list('recipe_id', 'ingredient_id')
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        recipe_ingredients = defaultdict(list)
+        for recipe_id, ingredient_id in rows.iterator(
+            chunk_size=STREAM_CHUNK_SIZE
+        ):
+            recipe_ingredients[recipe_id].append(ingredient_id)
+        return recipe_ingredients
+
+    def build(self):
+        started_at = timezone.now()
+        recipe_ingredients = self.load()
+        postings = defaultdict(list)
+        for recipe_id, ingredient_ids in recipe_ingredients.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        return started_at, {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }, {
+            recipe_id: tuple(ingredient_ids)
+            for recipe_id, ingredient_ids in recipe_ingredients.items()
+        }
+
+    def swap(self, state):
+        """Вызывается под self.lock."""
+        self.synced_at, self.postings, self.recipe_ingredients = state
+        # Изменения окна до начала построения применятся ещё раз
+        self.applied_changes = {}
+        self.built_at = monotonic()
+
+    def rebuild_in_background(self):
+        """Вызывается под self.lock."""
+        self.rebuilding = True
+
+        def run():
+            try:
+                state = self.build()
+                with self.lock:
+                    self.swap(state)
+            finally:
+                self.rebuilding = False
+                connection.close()
+
+        threading.Thread(
+            target=run, name='ingredient-index', daemon=True
+        ).start()
+
+    def remove_recipe(self, recipe_id):
+        for ingredient_id in self.recipe_ingredients.pop(recipe_id, ()):
+            recipe_ids = self.postings[ingredient_id]
+            position = bisect_left(recipe_ids, recipe_id)
+            if (position < len(recipe_ids)
+                    and recipe_ids[position] == recipe_id):
+                recipe_ids.pop(position)
+
+    def add_recipe(self, recipe_id, ingredient_ids):
+        self.recipe_ingredients[recipe_id] = tuple(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            insort(
+                self.postings.setdefault(ingredient_id, array('q')),
+                recipe_id
+            )
+
+    def apply_changes(self):
+        """Вызывается под self.lock."""
+        now = timezone.now()
+        window_start = self.synced_at - timedelta(seconds=RECIPE_CHANGES_LAG)
+        limit = INGREDIENT_INDEX_MAX_CHANGES + len(self.applied_changes)
+        rows = list(
+            get_changes_window(self.synced_at).order_by('id')
+            .values_list('id', 'recipe_id', 'created')[:limit]
+        )
+        if len(rows) == limit:
+            self.rebuild_in_background()
+            return
+        changes = [
+            row for row in rows if row[0] not in self.applied_changes
+        ]
+        recipe_ids = {recipe_id for _, recipe_id, _ in changes}
+        if recipe_ids:
+            recipe_ingredients = self.load(recipe_ids)
+            for recipe_id in recipe_ids:
+                self.remove_recipe(recipe_id)
+                if recipe_id in recipe_ingredients:
+                    self.add_recipe(
+                        recipe_id, recipe_ingredients[recipe_id])
+        self.applied_changes = {
+            change_id: created
+            for change_id, created in self.applied_changes.items()
+            if created >= window_start
+        }
+        self.applied_changes.update(
+            (change_id, created) for change_id, _, created in changes
+        )
+        self.synced_at = now
+
+    def sync(self):
+        with self.lock:
+            if self.built_at is None:
+                # Обычно индекс уже построен прогревом процесса
+                self.swap(self.build())
+                return
+            if self.rebuilding:
+                return
+            if (monotonic() - self.built_at
+                    > INGREDIENT_INDEX_REBUILD_INTERVAL):
+                self.rebuild_in_background()
+                return
+            self.apply_changes()
+
+    def count_matches(self, ingredient_ids):
+        matches = Counter()
+        for ingredient_id in ingredient_ids:
+            matches.update(self.postings.get(ingredient_id, ()))
+        return matches
+
+    def contains_all(self, ingredient_ids):
+        """Рецепты со всеми ингредиентами, сначала самые короткие."""
+        with self.lock:
+            postings = sorted(
+                (self.postings.get(ingredient_id, ()) for ingredient_id
+                 in ingredient_ids),
+                key=len,
+            )
+            if not postings or not postings[0]:
+                return []
+            recipe_ids = set(postings[0]).intersection(*postings[1:])
+            sizes = self.recipe_ingredients
+            return sorted(
+                recipe_ids, key=lambda recipe_id: (len(sizes[recipe_id]),
+                                                   recipe_id)
+            )
+
+    def contains_any(self, ingredient_ids):
+        """Рецепты хотя бы с одним ингредиентом по доле совпадения."""
+        with self.lock:
+            sizes = self.recipe_ingredients
+            matches = self.count_matches(ingredient_ids)
+            return sorted(
+                matches,
+                key=lambda recipe_id: (
+                    -matches[recipe_id] / len(sizes[recipe_id]),
+                    -matches[recipe_id],
+                    recipe_id,
+                )
+            )
+
+    def missing_at_most(self, ingredient_ids, max_missing):
+        """Рецепты, для которых не хватает не более max_missing
+        ингредиентов, сначала с наименьшей нехваткой."""
+        with self.lock:
+            sizes = self.recipe_ingredients
+            matches = self.count_matches(ingredient_ids)
+            missing = {
+                recipe_id: len(sizes[recipe_id]) - matched
+                for recipe_id, matched in matches.items()
+                if len(sizes[recipe_id]) - matched <= max_missing
+            }
+        return sorted(
+            missing,
+            key=lambda recipe_id: (missing[recipe_id], recipe_id)
+        )
+
+
+ingredient_index = IngredientIndex()
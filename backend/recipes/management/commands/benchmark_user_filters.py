@@ -0,0 +1,75 @@
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from api.filters import USER_RELATIONS
+from recipes.models import Tag
+from .explain_hot_queries import Command as ExplainCommand
+
+
+class Command(ExplainCommand):
+    help = ('Сравнивает фильтры is_favorited/is_in_shopping_cart через '
+            'подзапрос и через строки пользователя')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого строятся запросы'
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def get_cases(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        cases = {}
+        for flag in USER_RELATIONS:
+            cases[flag] = {flag: 'true'}
+            cases[f'{flag}+tags'] = {flag: 'true', 'tags': tags}
+            cases[f'{flag}+author'] = {flag: 'true', 'author': user.id}
+        cases['both'] = dict.fromkeys(USER_RELATIONS, 'true')
+        return cases
+
+    def filter_by_annotation(self, user, params):
+        """Прежний вариант: фильтр по Exists-аннотациям get_queryset."""
+        view, _ = self.get_recipe_view(user)
+        flags = {name: True for name in USER_RELATIONS if name in params}
+        other = {
+            name: value for name, value in params.items()
+            if name not in USER_RELATIONS
+        }
+        return self.filter_recipes(user, other).filter(**flags)
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            ids = [recipe.id for recipe in queryset.all()]
+            timings.append((perf_counter() - started) * 1000)
+        return ids, median(timings)
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        mismatched = []
+        for name, params in self.get_cases(user).items():
+            old_ids, old_time = self.measure(
+                self.filter_by_annotation(user, params)
+                .prefetch_related(None)[:page_size],
+                options['repeat'],
+            )
+            new_ids, new_time = self.measure(
+                self.filter_recipes(user, params)
+                .prefetch_related(None)[:page_size],
+                options['repeat'],
+            )
+            if old_ids != new_ids:
+                mismatched.append(name)
+            speedup = old_time / new_time if new_time else 0
+            self.stdout.write(
+                f'{name}: {len(new_ids)} строк, подзапрос {old_time:.1f} мс, '
+                f'строки пользователя {new_time:.1f} мс, x{speedup:.1f}'
+            )
+        if mismatched:
+            raise CommandError(
+                f'Результаты различаются: {", ".join(mismatched)}')
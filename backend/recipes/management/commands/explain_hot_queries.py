@@ -0,0 +1,89 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.filters import FilterRecipe
+from api.views import RecipeViewSet, UserViewSet
+from recipes.models import Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выводит планы и время горячих запросов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого строятся запросы'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+
+    def get_user(self, user_id):
+        queryset = User.objects.all()
+        if user_id:
+            queryset = queryset.filter(id=user_id)
+        user = queryset.order_by('id').first()
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        return user
+
+    def get_recipe_view(self, user, params=None):
+        request = Request(RequestFactory().get('/api/recipes/', params))
+        request.user = user
+        view = RecipeViewSet(request=request, action='list', format_kwarg=None)
+        return view, request
+
+    def filter_recipes(self, user, params):
+        view, request = self.get_recipe_view(user, params)
+        return FilterRecipe(
+            data=request.query_params, queryset=view.get_queryset(),
+            request=request,
+        ).qs
+
+    def get_queries(self, user):
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        view, _ = self.get_recipe_view(user)
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'recipes_list': view.get_queryset()[:page_size],
+            'recipes_by_author': self.filter_recipes(
+                user, {'author': user.id})[:page_size],
+            'recipes_by_tags': self.filter_recipes(
+                user, {'tags': tags})[:page_size],
+            'recipes_favorited': self.filter_recipes(
+                user, {'is_favorited': 'true'})[:page_size],
+            'recipes_in_shopping_cart': self.filter_recipes(
+                user, {'is_in_shopping_cart': 'true'})[:page_size],
+            'subscriptions': UserViewSet.get_subscriptions(user)[:page_size],
+            'download_shopping_cart': (
+                RecipeViewSet.get_shopping_cart_ingredients(user)
+            ),
+        }
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('ANALYZE доступен только для PostgreSQL.')
+            explain_options = {'analyze': True, 'buffers': True}
+        for name, queryset in self.get_queries(user).items():
+            # Без prefetch_related: нужен план только основного запроса
+            queryset = queryset.prefetch_related(None)
+            started = perf_counter()
+            rows = len(list(queryset))
+            elapsed = (perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: {rows} строк, {elapsed:.1f} мс'
+            ))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
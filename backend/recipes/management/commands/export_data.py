@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from foodgram.const import EXPORT_CHUNK_SIZE
+from recipes.ndjson import (TABLES, export_snapshot, export_table,
+                            export_table_from_snapshot, snapshot_transaction)
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка данных в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='export')
+        parser.add_argument(
+            '--tables', nargs='+', choices=TABLES, default=list(TABLES)
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать файлы gzip'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число таблиц, выгружаемых параллельно (PostgreSQL)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        Path(options['output']).mkdir(parents=True, exist_ok=True)
+        export_args = (options['output'], options['gzip'],
+                       options['chunk_size'])
+        # Все таблицы выгружаются из одного снимка: иначе избранное или
+        # корзины ссылаются на рецепты, которых нет в выгрузке
+        with snapshot_transaction():
+            snapshot_id = export_snapshot()
+            if snapshot_id is None:
+                # Снимок нельзя передать другим соединениям
+                for table in options['tables']:
+                    self.write_count(
+                        table, export_table(table, *export_args))
+                return
+            with ThreadPoolExecutor(
+                max_workers=options['workers']
+            ) as executor:
+                futures = {
+                    table: executor.submit(
+                        export_table_from_snapshot, snapshot_id, table,
+                        *export_args,
+                    )
+                    for table in options['tables']
+                }
+                for table, future in futures.items():
+                    self.write_count(table, future.result())
+
+    def write_count(self, table, count):
+        self.stdout.write(self.style.SUCCESS(f'{table}: выгружено {count}'))
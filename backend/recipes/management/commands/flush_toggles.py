@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.const import TOGGLE_ORPHAN_AGE
+from recipes.write_behind import recover_orphans
+
+
+class Command(BaseCommand):
+    help = ('Записывает в БД журналы отложенных переключений избранного и '
+            'корзины, оставшиеся от остановленных процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Забрать и свежие журналы (только при остановленном API)'
+        )
+
+    def handle(self, *args, **options):
+        changed = recover_orphans(0 if options['all'] else TOGGLE_ORPHAN_AGE)
+        self.stdout.write(self.style.SUCCESS(f'Изменено строк: {changed}'))
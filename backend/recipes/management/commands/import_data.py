@@ -0,0 +1,61 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.const import EXPORT_CHUNK_SIZE
+from recipes.ndjson import TABLES, get_path, import_table, reset_sequences
+
+
+class Command(BaseCommand):
+    help = 'Загрузка данных из NDJSON с продолжением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default='export')
+        parser.add_argument(
+            '--tables', nargs='+', choices=TABLES, default=list(TABLES)
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать заново, не учитывая сохранённый прогресс'
+        )
+
+    def find_file(self, table):
+        for compress in (False, True):
+            path = get_path(self.directory, table, compress)
+            if path.exists():
+                return path
+        raise CommandError(f'Не найден файл для таблицы {table}.')
+
+    def save_state(self):
+        temp_path = self.state_path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(self.state))
+        temp_path.replace(self.state_path)
+
+    def handle(self, *args, **options):
+        self.directory = Path(options['input'])
+        self.state_path = self.directory / '.import_state.json'
+        self.state = {}
+        if self.state_path.exists() and not options['restart']:
+            self.state = json.loads(self.state_path.read_text())
+        # Порядок TABLES, а не порядок аргументов: сначала справочники
+        for table in TABLES:
+            if table not in options['tables']:
+                continue
+            path = self.find_file(table)
+
+            def on_batch(line, table=table):
+                self.state[table] = line
+                self.save_state()
+
+            count = import_table(
+                table, path, options['chunk_size'],
+                start_line=self.state.get(table, 0), on_batch=on_batch,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f'{table}: загружено {count}')
+            )
+        reset_sequences()
@@ -0,0 +1,245 @@
+import json
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag, User
+
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+DEFAULT_MIX = 'browse=50,search=20,favorite=10,cart=10,subscribe=5,create=5'
+# Методы Client, которые можно указать в --mix
+SCENARIOS = ('browse', 'search', 'favorite', 'cart', 'subscribe', 'create')
+
+
+def percentile(values, rank):
+    index = max(0, min(len(values) - 1, round(rank / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Client:
+    """Один виртуальный пользователь со своим HTTP-соединением."""
+
+    def __init__(self, command, token, user_id, seed=None):
+        self.command = command
+        self.user_id = user_id
+        # Общий генератор модуля random потоки вызывают вперемешку, и
+        # порядок выборок зависел бы от планировщика
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Token {token}'
+
+    def request(self, method, name, path, **kwargs):
+        started = perf_counter()
+        try:
+            response = self.session.request(
+                method, self.command.base_url + path,
+                timeout=self.command.timeout, **kwargs
+            )
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        self.command.record(
+            f'{method} {name}', perf_counter() - started, status
+        )
+        return response
+
+    def browse(self):
+        self.request('GET', '/api/recipes/', '/api/recipes/', params={
+            'page': self.random.randint(1, self.command.pages)})
+        recipe_id = self.random.choice(self.command.recipe_ids)
+        self.request(
+            'GET', '/api/recipes/{id}/', f'/api/recipes/{recipe_id}/')
+
+    def search(self):
+        name = self.random.choice(self.command.ingredient_names)[:3]
+        self.request('GET', '/api/ingredients/?name=', '/api/ingredients/',
+                     params={'name': name})
+        if self.command.tag_slugs:
+            self.request('GET', '/api/recipes/?tags=', '/api/recipes/',
+                         params={'tags': self.random.choice(
+                             self.command.tag_slugs)})
+
+    def toggle(self, action):
+        recipe_id = self.random.choice(self.command.recipe_ids)
+        path = f'/api/recipes/{recipe_id}/{action}/'
+        name = f'/api/recipes/{{id}}/{action}/'
+        self.request('POST', name, path)
+        return path, name
+
+    def favorite(self):
+        path, name = self.toggle('favorite')
+        self.request('DELETE', name, path)
+
+    def cart(self):
+        path, name = self.toggle('shopping_cart')
+        self.request('GET', '/api/recipes/download_shopping_cart/',
+                     '/api/recipes/download_shopping_cart/')
+        self.request('DELETE', name, path)
+
+    def subscribe(self):
+        author_id = self.random.choice(self.command.author_ids)
+        if author_id == self.user_id:
+            return
+        path = f'/api/users/{author_id}/subscribe/'
+        self.request('POST', '/api/users/{id}/subscribe/', path)
+        self.request('GET', '/api/users/subscriptions/',
+                     '/api/users/subscriptions/',
+                     params={'recipes_limit': 3})
+        self.request('DELETE', '/api/users/{id}/subscribe/', path)
+
+    def create(self):
+        ingredient_ids = self.random.sample(
+            self.command.ingredient_ids,
+            min(3, len(self.command.ingredient_ids))
+        )
+        response = self.request('POST', '/api/recipes/', '/api/recipes/',
+                                json={
+                                    'name': 'Нагрузочный тест',
+                                    'text': 'Рецепт нагрузочного теста',
+                                    'cooking_time': 10,
+                                    'image': PNG,
+                                    'tags': self.command.tag_ids[:1],
+                                    'ingredients': [
+                                        {'id': pk, 'amount': 1}
+                                        for pk in ingredient_ids
+                                    ],
+                                })
+        if response is not None and response.status_code == 201:
+            recipe_id = response.json()['id']
+            self.request('DELETE', '/api/recipes/{id}/',
+                         f'/api/recipes/{recipe_id}/')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: смешанные сценарии параллельных '
+            'клиентов, результат в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--clients', type=int, default=20)
+        parser.add_argument(
+            '--duration', type=float, default=60, help='Секунды'
+        )
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help='Веса сценариев, например browse=50,create=5'
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def parse_mix(self, value):
+        mix = {}
+        for item in value.split(','):
+            name, _, weight = item.partition('=')
+            if name.strip() not in SCENARIOS:
+                raise CommandError(f'Неизвестный сценарий {name!r}.')
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    def prepare(self, clients):
+        self.recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:1000])
+        self.ingredient_names = list(
+            Ingredient.objects.values_list('name', flat=True)[:1000])
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.author_ids = list(
+            User.objects.filter(recipes__isnull=False).distinct()
+            .values_list('id', flat=True)[:1000])
+        if not (self.recipe_ids and self.ingredient_ids and self.tag_ids):
+            raise CommandError('Нужны рецепты, ингредиенты и теги в БД.')
+        self.pages = max(1, len(self.recipe_ids) // 12)
+        users = []
+        for number in range(clients):
+            user, _ = User.objects.get_or_create(
+                email=f'loadtest_{number}@example.com',
+                defaults={'username': f'loadtest_{number}',
+                          'first_name': 'Load', 'last_name': 'Test'},
+            )
+            token, _ = Token.objects.get_or_create(user=user)
+            users.append((token.key, user.id))
+        return users
+
+    def record(self, name, elapsed, status):
+        with self.lock:
+            self.results[name].append(
+                (elapsed, status is not None and status < 400)
+            )
+
+    def run_client(self, token, user_id, deadline, seed):
+        client = Client(self, token, user_id, seed)
+        scenarios = list(self.mix)
+        weights = list(self.mix.values())
+        while monotonic() < deadline:
+            getattr(client, client.random.choices(scenarios, weights)[0])()
+
+    def build_report(self, elapsed, options):
+        endpoints = {}
+        total = errors = 0
+        for name, samples in sorted(self.results.items()):
+            latencies = sorted(sample[0] * 1000 for sample in samples)
+            failed = sum(1 for sample in samples if not sample[1])
+            total += len(samples)
+            errors += failed
+            endpoints[name] = {
+                'requests': len(samples),
+                'rps': round(len(samples) / elapsed, 2),
+                'error_rate': round(failed / len(samples), 4),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+            }
+        return {
+            'config': {
+                'base_url': self.base_url,
+                'clients': options['clients'],
+                'duration': options['duration'],
+                'mix': self.mix,
+            },
+            'total': {
+                'requests': total,
+                'rps': round(total / elapsed, 2),
+                'error_rate': round(errors / total, 4) if total else 0,
+            },
+            'endpoints': endpoints,
+        }
+
+    def handle(self, *args, **options):
+        seed = options['seed']
+        self.base_url = options['base_url'].rstrip('/')
+        self.timeout = options['timeout']
+        self.mix = self.parse_mix(options['mix'])
+        self.results = defaultdict(list)
+        self.lock = threading.Lock()
+        users = self.prepare(options['clients'])
+        started = monotonic()
+        deadline = started + options['duration']
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            for future in [
+                executor.submit(
+                    self.run_client, token, user_id, deadline,
+                    None if seed is None else seed + index,
+                )
+                for index, (token, user_id) in enumerate(users)
+            ]:
+                future.result()
+        report = json.dumps(
+            self.build_report(monotonic() - started, options),
+            ensure_ascii=False, indent=2, sort_keys=True,
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report + '\n')
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from foodgram.const import PARTITION_COPY_BATCH_SIZE, PARTITIONS_COUNT
+from recipes.models import Recipe, RecipeIngredient
+from recipes.partitioning import PARTITIONED_MODELS, PartitionedTable
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Hash-секционирование избранного и корзины по user_id: '
+            'create, copy, swap, check')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'step', choices=('create', 'copy', 'swap', 'check')
+        )
+        parser.add_argument(
+            '--tables', nargs='+', choices=PARTITIONED_MODELS,
+            default=list(PARTITIONED_MODELS)
+        )
+        parser.add_argument(
+            '--partitions', type=int, default=PARTITIONS_COUNT
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=PARTITION_COPY_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--sql', action='store_true',
+            help='Вывести SQL шага для проверки, ничего не выполняя'
+        )
+
+    def get_queries(self, model):
+        """Запросы api/views.py к таблице с фильтром по пользователю."""
+        user = User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError('Для проверки нужен хотя бы 1 пользователь.')
+        user_rows = model.objects.filter(user=user)
+        queries = {
+            'exists_annotation': Recipe.objects.annotate(
+                flag=Exists(user_rows.filter(recipe=OuterRef('pk')))
+            ),
+            'toggle_lookup': user_rows.filter(recipe_id=1),
+        }
+        if model is PARTITIONED_MODELS['shopping_carts']:
+            queries['download_shopping_cart'] = (
+                RecipeIngredient.objects.filter(
+                    recipe__shopping_carts__user=user)
+            )
+        return queries
+
+    def check_pruning(self, table):
+        failed = False
+        for name, queryset in self.get_queries(table.model).items():
+            partitions = table.scanned_partitions(queryset)
+            if len(partitions) == 1:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{table.table} {name}: секция {partitions.pop()}'))
+                continue
+            failed = True
+            self.stdout.write(self.style.ERROR(
+                f'{table.table} {name}: просматриваются секции '
+                f'{sorted(partitions) or "-"}'))
+        return failed
+
+    def write_sql(self, table, options):
+        if options['step'] == 'create':
+            statements = table.create_sql(options['partitions'])
+        elif options['step'] == 'copy':
+            self.stdout.write(
+                f'-- для каждой пачки из {options["batch_size"]} id '
+                'в отдельной транзакции')
+            statements = [table.copy_sql()]
+        else:
+            statements = table.swap_sql()
+        if options['step'] != 'copy':
+            # create и swap выполняются одной транзакцией
+            statements = ['BEGIN', *statements, 'COMMIT']
+        for statement in statements:
+            self.stdout.write(f'{statement};')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование доступно только в PostgreSQL.')
+        if options['sql'] and options['step'] == 'check':
+            raise CommandError('--sql доступен для create, copy и swap.')
+        tables = [
+            PartitionedTable(PARTITIONED_MODELS[name])
+            for name in options['tables']
+        ]
+        if options['sql']:
+            for table in tables:
+                self.write_sql(table, options)
+            return
+        failed = False
+        for table in tables:
+            if options['step'] == 'create':
+                table.create(options['partitions'])
+            elif options['step'] == 'copy':
+                def on_batch(current, last, table=table):
+                    self.stdout.write(f'{table.table}: {current}/{last}')
+                copied = table.copy(options['batch_size'], on_batch)
+                self.stdout.write(f'{table.table}: перенесено {copied}')
+            elif options['step'] == 'swap':
+                table.swap()
+            else:
+                failed |= self.check_pruning(table)
+        if failed:
+            raise CommandError('Есть запросы без отсечения секций.')
+        self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.const import DELETION_BATCH_SIZE, DELETION_POLL_INTERVAL
+from recipes.deletion import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Удаляет помеченных пользователей и рецепты порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DELETION_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Работать постоянно, проверяя новые задания'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=DELETION_POLL_INTERVAL
+        )
+
+    def on_batch(self, job):
+        self.stdout.write(f'{job}: удалено строк {job.deleted}')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending(options['batch_size'], self.on_batch)
+            if processed:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Выполнено заданий: {processed}')
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
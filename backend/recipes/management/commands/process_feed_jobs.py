@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.const import FEED_POLL_INTERVAL
+from recipes.feed import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задания рассылки рецептов в ленты подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Работать постоянно, проверяя новые задания'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=FEED_POLL_INTERVAL
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending()
+            if processed:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Выполнено заданий: {processed}')
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram.const import RECIPE_CHANGES_LAG, RECIPE_CHANGES_RETENTION_DAYS
+from recipes.models import RecipeChange
+from recipes.similarity import get_synced_at
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые записи журнала изменений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=RECIPE_CHANGES_RETENTION_DAYS
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        synced_at = get_synced_at()
+        if synced_at is not None:
+            # Записи, которые update_similar_recipes ещё не прочитал
+            cutoff = min(
+                cutoff, synced_at - timedelta(seconds=RECIPE_CHANGES_LAG)
+            )
+        deleted, _ = RecipeChange.objects.filter(
+            created__lt=cutoff
+        ).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено записей журнала: {deleted}')
+        )
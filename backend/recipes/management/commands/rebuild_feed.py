@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import backfill_subscription, refresh_fan_in_authors
+from recipes.models import Subscribe
+from foodgram.const import FEED_FANOUT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fan-in-only', action='store_true',
+            help='Только обновить список авторов с чтением ленты '
+                 'при запросе (для периодического запуска)'
+        )
+
+    def handle(self, *args, **options):
+        fan_in = refresh_fan_in_authors()
+        self.stdout.write(f'Авторов с чтением ленты при запросе: {fan_in}')
+        if options['fan_in_only']:
+            return
+        subscriptions = Subscribe.objects.order_by().values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=FEED_FANOUT_BATCH_SIZE)
+        count = 0
+        for user_id, author_id in subscriptions:
+            backfill_subscription(user_id, author_id)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Ленты заполнены по {count} подпискам')
+        )
@@ -0,0 +1,61 @@
+import logging
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from foodgram.const import (
+    ANALYTICS_LAG,
+    MEDIA_SWEEP_INTERVAL,
+    RANKING_UPDATE_INTERVAL,
+    RECIPE_CHANGES_PRUNE_INTERVAL,
+    SIMILAR_UPDATE_INTERVAL,
+    TOGGLE_ORPHAN_AGE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Команда и интервал между запусками в секундах
+TASKS = (
+    ('flush_toggles', TOGGLE_ORPHAN_AGE),
+    ('update_ranking', RANKING_UPDATE_INTERVAL),
+    ('update_analytics', ANALYTICS_LAG),
+    ('update_similar_recipes', SIMILAR_UPDATE_INTERVAL),
+    ('prune_recipe_changes', RECIPE_CHANGES_PRUNE_INTERVAL),
+    # Файлы удалённых рецептов и аватаров
+    ('sweep_media', MEDIA_SWEEP_INTERVAL),
+)
+
+
+class Command(BaseCommand):
+    help = ('Запускает периодические пересчёты по расписанию: '
+            + ', '.join(name for name, _ in TASKS))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить каждую задачу один раз (для cron)'
+        )
+
+    def run_task(self, name):
+        close_old_connections()
+        try:
+            call_command(name, stdout=self.stdout, stderr=self.stderr)
+        except Exception:
+            # Ошибка одной задачи не останавливает остальные
+            logger.exception('Задача %s завершилась ошибкой', name)
+        finally:
+            close_old_connections()
+
+    def handle(self, *args, **options):
+        next_run = {name: 0 for name, _ in TASKS}
+        while True:
+            for name, interval in TASKS:
+                if next_run[name] > time.monotonic():
+                    continue
+                self.run_task(name)
+                next_run[name] = time.monotonic() + interval
+            if options['once']:
+                break
+            time.sleep(max(0, min(next_run.values()) - time.monotonic()))
@@ -0,0 +1,107 @@
+import os
+import shutil
+from pathlib import Path
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.const import MEDIA_SWEEP_BATCH_SIZE, MEDIA_SWEEP_GRACE_HOURS
+from recipes.models import Recipe, User
+
+# Каталог MEDIA_ROOT и поле, которое ссылается на его файлы
+MEDIA_FIELDS = (
+    ('recipes', Recipe, 'image'),
+    ('avatars', User, 'avatar'),
+)
+
+
+def scan_files(path):
+    """Рекурсивный обход каталога без построения полного списка."""
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы в MEDIA_ROOT, на которые нет ссылок в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+        parser.add_argument(
+            '--grace-hours', type=float, default=MEDIA_SWEEP_GRACE_HOURS,
+            help='Не трогать файлы моложе этого возраста'
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить файлы в этот каталог вместо удаления'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=MEDIA_SWEEP_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        if settings.MEDIA_STORAGE != 'filesystem':
+            raise CommandError(
+                'Очистка работает только с MEDIA_ROOT '
+                '(MEDIA_STORAGE=filesystem).')
+        self.options = options
+        self.media_root = Path(settings.MEDIA_ROOT)
+        self.deadline = time() - options['grace_hours'] * 60 * 60
+        self.scanned = self.orphans = self.reclaimed = 0
+        for directory, model, field in MEDIA_FIELDS:
+            batch = []
+            for entry in scan_files(self.media_root / directory):
+                self.scanned += 1
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > self.deadline:
+                    continue
+                batch.append((entry, stat.st_size))
+                if len(batch) == options['batch_size']:
+                    self.sweep_batch(model, field, batch)
+                    batch = []
+            self.sweep_batch(model, field, batch)
+        action = 'будет освобождено' if options['dry_run'] else 'освобождено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {self.scanned}, без ссылок: '
+            f'{self.orphans}, {action} байт: {self.reclaimed}'
+        ))
+
+    def sweep_batch(self, model, field, batch):
+        if not batch:
+            return
+        names = {
+            Path(entry.path).relative_to(self.media_root).as_posix(): (
+                entry, size)
+            for entry, size in batch
+        }
+        referenced = set(
+            model.objects.filter(**{f'{field}__in': names})
+            .values_list(field, flat=True)
+        )
+        for name, (entry, size) in names.items():
+            if name in referenced:
+                continue
+            self.orphans += 1
+            self.reclaimed += size
+            if self.options['dry_run']:
+                self.stdout.write(name)
+            elif self.options['quarantine']:
+                # shutil.move копирует между файловыми системами и, в
+                # отличие от os.renames, не удаляет опустевшие каталоги,
+                # которые ещё обходит scan_files
+                target = Path(self.options['quarantine']) / name
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(entry.path, target)
+            else:
+                os.remove(entry.path)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.const import ANALYTICS_BATCH_SIZE
+from recipes.analytics import update_analytics
+
+
+class Command(BaseCommand):
+    help = 'Дополняет дневные агрегаты аналитики новыми строками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=ANALYTICS_BATCH_SIZE,
+            help='Размер диапазона id за одну транзакцию'
+        )
+
+    def handle(self, *args, **options):
+        for name, batches in update_analytics(
+                options['batch_size']).items():
+            self.stdout.write(f'{name}: диапазонов {batches}')
+        self.stdout.write(self.style.SUCCESS('Готово'))
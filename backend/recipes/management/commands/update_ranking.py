@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import seed_scores, update_ranking
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг рецептов по новым событиям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать популярность по всем строкам избранного и '
+                 'корзины (один раз после развёртывания)'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            batches = seed_scores()
+            self.stdout.write(f'Пересчитано пачек рецептов: {batches}')
+        processed = update_ranking()
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано событий: {processed}')
+        )
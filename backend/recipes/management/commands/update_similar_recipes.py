@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.const import SIMILAR_BATCH_SIZE, SIMILAR_TOP_K
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие рецепты для изменённых рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты'
+        )
+        parser.add_argument('--top-k', type=int, default=SIMILAR_TOP_K)
+        parser.add_argument(
+            '--batch-size', type=int, default=SIMILAR_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        processed = update_similar_recipes(
+            full=options['full'],
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано рецептов: {processed}')
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Прогревает кэши процесса и показывает время каждой фазы'
+
+    def handle(self, *args, **options):
+        for name, elapsed in warm_up().items():
+            self.stdout.write(f'{name}: {elapsed:.1f} мс')
+        self.stdout.write(self.style.SUCCESS('Прогрев завершён'))
@@ -6,6 +6,7 @@ from django.db import models
 from django.db.models import UniqueConstraint
 from django.core.exceptions import ValidationError
 from django.db.models import Q
+from django.utils import timezone
 
 
 from foodgram.const import (
@@ -23,6 +24,23 @@ from foodgram.const import (
 )
 
 
+class TimestampedModel(models.Model):
+    """Время создания и изменения для инкрементальной синхронизации."""
+    created_at = models.DateTimeField(
+        verbose_name='Создано',
+        default=timezone.now,
+        db_index=True,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Изменено',
+        auto_now=True,
+        db_index=True,
+    )
+
+    class Meta:
+        abstract = True
+
+
 class Subscribe(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -52,6 +70,13 @@ class Subscribe(models.Model):
                 name='prevent_self_subscription'
             )
         ]
+        indexes = [
+            # Подписки пользователя (UserViewSet.subscriptions)
+            models.Index(
+                fields=('user', 'author'),
+                name='subscribe_user_author_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} на автора {self.author}"
@@ -63,7 +88,7 @@ class Subscribe(models.Model):
         super().clean()
 
 
-class User(AbstractUser):
+class User(TimestampedModel, AbstractUser):
     username = models.CharField(
         verbose_name='Логин',
         unique=True,
@@ -88,6 +113,11 @@ class User(AbstractUser):
         verbose_name='Аватар',
         blank=True,
         default='',
+        db_index=True,
+    )
+    pending_deletion = models.BooleanField(
+        verbose_name='Ожидает удаления',
+        default=False,
     )
 
     REQUIRED_FIELDS = ['username', 'last_name', 'first_name', 'password']
@@ -102,7 +132,7 @@ class User(AbstractUser):
         return self.username
 
 
-class Tag(models.Model):
+class Tag(TimestampedModel):
     name = models.CharField(
         max_length=MAX_LENGTH_TAG_MAX,
         verbose_name='Название',
@@ -123,7 +153,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Ingredient(models.Model):
+class Ingredient(TimestampedModel):
     name = models.CharField(
         verbose_name='Название',
         max_length=MAX_LENGTH_INGREDIENT,
@@ -148,7 +178,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(TimestampedModel):
     name = models.CharField(
         verbose_name='Название',
         max_length=MAX_LENGTH_NAME_RECIPE,
@@ -160,6 +190,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
         upload_to='recipes/',
+        db_index=True,
     )
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -183,11 +214,29 @@ class Recipe(models.Model):
         validators=[MinValueValidator(TIME_COOK_VALUE_MIN),
                     MaxValueValidator(TIME_COOK_VALUE_MAX)],
     )
+    pending_deletion = models.BooleanField(
+        verbose_name='Ожидает удаления',
+        default=False,
+    )
 
     class Meta:
         verbose_name_plural = 'Рецепты'
         verbose_name = 'Рецепт'
         ordering = ('name',)
+        indexes = [
+            # Список рецептов с сортировкой по умолчанию
+            models.Index(fields=('name',), name='recipe_name_idx'),
+            # Фильтр ?author= с той же сортировкой
+            models.Index(
+                fields=('author', 'name'),
+                name='recipe_author_name_idx'
+            ),
+            # Последние рецепты автора (лента подписок)
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -222,6 +271,14 @@ class RecipeIngredient(models.Model):
                 name='unique_recipe_ingredient_pair'
             )
         ]
+        indexes = [
+            # Покрывающий индекс для суммирования списка покупок
+            models.Index(
+                fields=('recipe', 'ingredient'),
+                include=('amount',),
+                name='recipe_ingredient_amount_idx'
+            ),
+        ]
 
     def __str__(self):
         return (f'{self.recipe.name}: {self.ingredient.name} - {self.amount} '
@@ -249,6 +306,13 @@ class UserRecipeBaseModel(models.Model):
                 name='%(app_label)s_%(class)s_unique'  # Автогенерация имени
             )
         ]
+        indexes = [
+            # Поиск по рецепту: счётчики, рейтинг, удаление рецепта
+            models.Index(
+                fields=('recipe', 'user'),
+                name='%(class)s_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.recipe} | {self.user}'
@@ -266,3 +330,395 @@ class ShoppingCart(UserRecipeBaseModel):
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
         default_related_name = 'shopping_carts'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Подписчик',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    # Денормализовано для быстрой очистки ленты при отписке
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        ordering = ('-recipe',)
+        constraints = [
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_entry_user_author_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class FeedJob(models.Model):
+    """Запись в ленты вне запроса; выполняется process_feed_jobs."""
+    FAN_OUT = 'fan_out'
+    BACKFILL = 'backfill'
+    KINDS = (
+        (FAN_OUT, 'Рассылка рецепта'),
+        (BACKFILL, 'Заполнение по подписке'),
+    )
+
+    kind = models.CharField(
+        verbose_name='Тип',
+        max_length=MAX_LENGTH_TAG_SLUG,
+        choices=KINDS,
+    )
+    # Без внешних ключей: объекты проверяются при выполнении задания
+    recipe_id = models.BigIntegerField(
+        verbose_name='id рецепта',
+        null=True,
+    )
+    user_id = models.BigIntegerField(
+        verbose_name='id подписчика',
+        null=True,
+    )
+    author_id = models.BigIntegerField(
+        verbose_name='id автора',
+        null=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Создано',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Задание ленты'
+        verbose_name_plural = 'Задания ленты'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.kind} {self.id}'
+
+
+class FanInAuthor(models.Model):
+    """Авторы, чьи рецепты добавляются в ленту при чтении, а не
+    рассылаются подписчикам. Список обновляет rebuild_feed."""
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+    )
+    followers = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+    )
+
+    class Meta:
+        verbose_name = 'Автор с чтением ленты при запросе'
+        verbose_name_plural = 'Авторы с чтением ленты при запросе'
+        ordering = ('-followers',)
+
+    def __str__(self):
+        return f'{self.author}: {self.followers}'
+
+
+class Watermark(models.Model):
+    """Позиция инкрементальных фоновых пересчётов."""
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=MAX_LENGTH_TAG_SLUG,
+        unique=True,
+    )
+    value = models.BigIntegerField(
+        verbose_name='Значение',
+        default=0,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Обновлено',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Отметка пересчёта'
+        verbose_name_plural = 'Отметки пересчётов'
+        ordering = ('name',)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+
+class RecipeActivity(models.Model):
+    """Необработанные события избранного и корзины для рейтинга."""
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='activities',
+    )
+    weight = models.SmallIntegerField(
+        verbose_name='Вес',
+    )
+    created = models.DateTimeField(
+        verbose_name='Время события',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Событие рецепта'
+        verbose_name_plural = 'События рецептов'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.recipe}: {self.weight:+d}'
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+    )
+    score_all = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+    )
+    # Затухающие оценки хранятся относительно эпохи ranking_epoch,
+    # поэтому их не нужно пересчитывать при каждом обновлении
+    score_week = models.FloatField(
+        verbose_name='Популярность за неделю',
+        default=0,
+    )
+    score_day = models.FloatField(
+        verbose_name='Популярность за сутки',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        ordering = ('-score_all',)
+        indexes = [
+            models.Index(fields=('-score_all',), name='score_all_idx'),
+            models.Index(fields=('-score_week',), name='score_week_idx'),
+            models.Index(fields=('-score_day',), name='score_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score_all}'
+
+
+class RecipeChange(models.Model):
+    """Журнал изменений рецептов для инкрементальных индексов."""
+    # Без внешнего ключа: запись должна пережить удаление рецепта
+    recipe_id = models.BigIntegerField(
+        verbose_name='id рецепта',
+    )
+    created = models.DateTimeField(
+        verbose_name='Время изменения',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.recipe_id} ({self.created})'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score')
+        constraints = [
+            UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}: {self.score:.3f}'
+
+
+class DeletionJob(models.Model):
+    """Фоновое удаление пользователя или рецепта порциями."""
+    USER = 'user'
+    RECIPE = 'recipe'
+    TARGETS = (
+        (USER, 'Пользователь'),
+        (RECIPE, 'Рецепт'),
+    )
+
+    target = models.CharField(
+        verbose_name='Объект',
+        max_length=MAX_LENGTH_TAG_SLUG,
+        choices=TARGETS,
+    )
+    # Без внешнего ключа: задание переживает удаление объекта
+    object_id = models.BigIntegerField(
+        verbose_name='id объекта',
+    )
+    stage = models.CharField(
+        verbose_name='Этап',
+        max_length=MAX_LENGTH_TAG_SLUG,
+        blank=True,
+    )
+    deleted = models.PositiveIntegerField(
+        verbose_name='Удалено строк',
+        default=0,
+    )
+    created = models.DateTimeField(
+        verbose_name='Создано',
+        default=timezone.now,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Обновлено',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Задание удаления'
+        verbose_name_plural = 'Задания удаления'
+        ordering = ('id',)
+        constraints = [
+            UniqueConstraint(
+                fields=('target', 'object_id'),
+                name='unique_deletion_job'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.target} {self.object_id}: {self.stage or "ожидает"}'
+
+
+class Tombstone(models.Model):
+    """Удалённые объекты для синхронизации клиентов (?updated_since)."""
+    model = models.CharField(
+        verbose_name='Модель',
+        max_length=MAX_LENGTH_TAG_SLUG,
+    )
+    # Без внешнего ключа: объект уже удалён
+    object_id = models.BigIntegerField(
+        verbose_name='id объекта',
+    )
+    deleted_at = models.DateTimeField(
+        verbose_name='Удалено',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Удалённый объект'
+        verbose_name_plural = 'Удалённые объекты'
+        ordering = ('id',)
+        indexes = [
+            models.Index(
+                fields=('model', 'id'),
+                name='tombstone_model_id_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
+
+
+class DailyRollup(models.Model):
+    """Дневные агрегаты для аналитики в админке (recipes.analytics)."""
+    INGREDIENTS = 'ingredients'
+    TAGS = 'tags'
+    SIGNUPS = 'signups'
+    FOLLOWERS = 'followers'
+    FAVORITES = 'favorites'
+    METRICS = (
+        (INGREDIENTS, 'Ингредиенты в новых рецептах'),
+        (TAGS, 'Теги новых рецептов'),
+        (SIGNUPS, 'Регистрации'),
+        (FOLLOWERS, 'Новые подписчики авторов'),
+        (FAVORITES, 'Добавления в избранное'),
+    )
+
+    metric = models.CharField(
+        verbose_name='Показатель',
+        max_length=MAX_LENGTH_TAG_SLUG,
+        choices=METRICS,
+    )
+    day = models.DateField(
+        verbose_name='День',
+    )
+    # Без внешнего ключа: агрегаты переживают удаление объекта
+    object_id = models.BigIntegerField(
+        verbose_name='id объекта',
+        default=0,
+    )
+    label = models.CharField(
+        verbose_name='Объект',
+        max_length=MAX_LENGTH_NAME_RECIPE,
+        blank=True,
+    )
+    value = models.PositiveIntegerField(
+        verbose_name='Значение',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Дневной агрегат'
+        verbose_name_plural = 'Аналитика'
+        ordering = ('-day', 'metric', '-value')
+        constraints = [
+            UniqueConstraint(
+                fields=('metric', 'day', 'object_id'),
+                name='unique_daily_rollup'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('metric', 'day'),
+                name='daily_rollup_metric_day_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.metric} {self.label}: {self.value}'
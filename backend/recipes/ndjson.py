@@ -0,0 +1,223 @@
+"""Потоковый экспорт и импорт данных в NDJSON (одна строка - объект)."""
+import gzip
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Subscribe, Tag, User)
+
+# Порядок важен для импорта: ссылки идут только на предыдущие таблицы
+TABLES = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+    'users': User,
+    'recipes': Recipe,
+    'subscriptions': Subscribe,
+    'favorites': Favorite,
+    'shopping_carts': ShoppingCart,
+}
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder отбрасывает микросекунды, для бэкапа они нужны
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+encoder = ExportEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def get_path(directory, table, compress):
+    return Path(directory) / (
+        f'{table}.ndjson.gz' if compress else f'{table}.ndjson'
+    )
+
+
+def open_file(path, mode):
+    if path.suffix == '.gz':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def get_field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def iter_batches(model, chunk_size):
+    """Keyset-пагинация по первичному ключу без OFFSET."""
+    fields = get_field_names(model)
+    last_id = 0
+    while True:
+        rows = list(
+            model.objects.filter(pk__gt=last_id).order_by('pk')
+            .values(*fields)[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+def add_recipe_relations(rows):
+    recipe_ids = [row['id'] for row in rows]
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, amount in (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by().values_list('recipe_id', 'ingredient_id', 'amount')
+    ):
+        ingredients[recipe_id].append(
+            {'ingredient_id': ingredient_id, 'amount': amount}
+        )
+    tags = defaultdict(list)
+    for recipe_id, tag_id in (
+        Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids)
+        .order_by().values_list('recipe_id', 'tag_id')
+    ):
+        tags[recipe_id].append(tag_id)
+    for row in rows:
+        row['ingredients'] = ingredients[row['id']]
+        row['tags'] = tags[row['id']]
+
+
+@contextmanager
+def snapshot_transaction(snapshot_id=None):
+    """Транзакция, все чтения которой видят один снимок базы.
+
+    С snapshot_id (PostgreSQL) транзакция читает снимок другой
+    транзакции, выданный export_snapshot(): так потоки выгрузки видят
+    одни и те же строки, и ссылки между таблицами не расходятся.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                if snapshot_id is not None:
+                    cursor.execute(
+                        'SET TRANSACTION SNAPSHOT %s', [snapshot_id])
+        yield
+
+
+def export_snapshot():
+    """id снимка текущей транзакции для других соединений или None,
+    если СУБД этого не умеет."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_export_snapshot()')
+        return cursor.fetchone()[0]
+
+
+def export_table(table, directory, compress, chunk_size):
+    model = TABLES[table]
+    path = get_path(directory, table, compress)
+    count = 0
+    with open_file(path, 'w') as file:
+        for rows in iter_batches(model, chunk_size):
+            if model is Recipe:
+                add_recipe_relations(rows)
+            file.write(
+                ''.join(encoder.encode(row) + '\n' for row in rows)
+            )
+            count += len(rows)
+    return count
+
+
+def export_table_from_snapshot(snapshot_id, *args):
+    """export_table в отдельном потоке со своим соединением."""
+    try:
+        with snapshot_transaction(snapshot_id):
+            return export_table(*args)
+    finally:
+        connection.close()
+
+
+@contextmanager
+def keep_auto_now(model):
+    """Отключает auto_now полей модели: bulk_create вызывает pre_save,
+    который заменил бы выгруженное время изменения текущим, и клиенты
+    синхронизации перечитали бы все восстановленные строки."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+    ]
+    for field in fields:
+        field.auto_now = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now = True
+
+
+def create_objects(model, rows):
+    if model is not Recipe:
+        with keep_auto_now(model):
+            model.objects.bulk_create(
+                (model(**row) for row in rows), ignore_conflicts=True
+            )
+        return
+    recipe_ingredients, recipe_tags = [], []
+    recipes = []
+    for row in rows:
+        recipe_ingredients.extend(
+            RecipeIngredient(recipe_id=row['id'], **ingredient)
+            for ingredient in row.pop('ingredients')
+        )
+        recipe_tags.extend(
+            Recipe.tags.through(recipe_id=row['id'], tag_id=tag_id)
+            for tag_id in row.pop('tags')
+        )
+        recipes.append(Recipe(**row))
+    with keep_auto_now(Recipe):
+        Recipe.objects.bulk_create(recipes, ignore_conflicts=True)
+    RecipeIngredient.objects.bulk_create(
+        recipe_ingredients, ignore_conflicts=True)
+    Recipe.tags.through.objects.bulk_create(
+        recipe_tags, ignore_conflicts=True)
+
+
+def import_table(table, path, chunk_size, start_line=0, on_batch=None):
+    """Импортирует файл пачками, начиная со строки start_line.
+
+    on_batch(line) вызывается после каждой зафиксированной пачки, чтобы
+    прерванный импорт можно было продолжить с этого места.
+    """
+    model = TABLES[table]
+    line_number = 0
+    rows = []
+    with open_file(path, 'r') as file:
+        for line_number, line in enumerate(file, start=1):
+            if line_number <= start_line:
+                continue
+            rows.append(json.loads(line))
+            if len(rows) == chunk_size:
+                with transaction.atomic():
+                    create_objects(model, rows)
+                rows = []
+                if on_batch:
+                    on_batch(line_number)
+    if rows:
+        with transaction.atomic():
+            create_objects(model, rows)
+    if on_batch:
+        on_batch(line_number)
+    return max(line_number - start_line, 0)
+
+
+def reset_sequences():
+    """После вставки с явными id счётчики PostgreSQL нужно сдвинуть."""
+    models = list(TABLES.values()) + [RecipeIngredient, Recipe.tags.through]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
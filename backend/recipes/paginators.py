@@ -0,0 +1,34 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from foodgram.const import ADMIN_ESTIMATED_COUNT_THRESHOLD
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки, не выполняющий COUNT(*) по большим таблицам.
+
+    Для запросов без фильтров на PostgreSQL число строк берётся из
+    статистики планировщика (pg_class.reltuples).
+    """
+
+    def get_estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+    @cached_property
+    def count(self):
+        estimated = self.get_estimated_count()
+        if (estimated is not None
+                and estimated > ADMIN_ESTIMATED_COUNT_THRESHOLD):
+            return estimated
+        return super().count
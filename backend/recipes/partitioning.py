@@ -0,0 +1,181 @@
+"""Перевод Favorite и ShoppingCart на hash-секционирование по user_id.
+
+Только PostgreSQL. Порядок шагов:
+1. create - секционированная копия таблицы и триггер, зеркалирующий в
+   неё вставки и удаления исходной таблицы;
+2. copy - перенос существующих строк пачками по id;
+3. swap - подмена таблиц под короткой блокировкой.
+Исходная таблица остаётся под именем <table>_unpartitioned.
+SQL каждого шага можно проверить заранее: partition_tables <шаг> --sql.
+"""
+from django.db import connection, transaction
+
+from .models import Favorite, ShoppingCart
+
+PARTITIONED_MODELS = {
+    'favorites': Favorite,
+    'shopping_carts': ShoppingCart,
+}
+
+
+class PartitionedTable:
+
+    def __init__(self, model):
+        self.model = model
+        meta = model._meta
+        self.table = meta.db_table
+        self.new_table = f'{self.table}_part'
+        self.old_table = f'{self.table}_unpartitioned'
+        self.sequence = f'{self.table}_id_seq'
+        self.columns = [field.column for field in meta.concrete_fields]
+        self.unique_name = meta.constraints[0].name
+        self.index_name = meta.indexes[0].name
+
+    def quote(self, name):
+        return connection.ops.quote_name(name)
+
+    def partition_name(self, remainder):
+        return f'{self.table}_p{remainder}'
+
+    def column_definitions(self):
+        definitions = []
+        for field in self.model._meta.concrete_fields:
+            if field.primary_key:
+                definitions.append(
+                    f'{self.quote(field.column)} bigint NOT NULL '
+                    f"DEFAULT nextval('{self.sequence}')"
+                )
+                continue
+            definitions.append(
+                f'{self.quote(field.column)} '
+                f'{field.db_type(connection)} NOT NULL'
+            )
+        return definitions
+
+    def foreign_key_definitions(self):
+        return [
+            ', FOREIGN KEY ({}) REFERENCES {} ({}) '
+            'DEFERRABLE INITIALLY DEFERRED'.format(
+                self.quote(field.column),
+                self.quote(field.related_model._meta.db_table),
+                self.quote(field.target_field.column),
+            )
+            for field in self.model._meta.concrete_fields
+            if field.is_relation
+        ]
+
+    def create_sql(self, partitions):
+        table, new = self.quote(self.table), self.quote(self.new_table)
+        columns = ', '.join(self.quote(column) for column in self.columns)
+        values = ', '.join(f'NEW.{self.quote(column)}'
+                           for column in self.columns)
+        function = self.quote(f'{self.table}_mirror')
+        statements = [
+            f'CREATE TABLE {new} ('
+            + ', '.join(self.column_definitions())
+            + ', PRIMARY KEY ("id", "user_id")'
+            + ', CONSTRAINT {} UNIQUE ("user_id", "recipe_id")'.format(
+                self.quote(f'{self.unique_name}_part'))
+            + ''.join(self.foreign_key_definitions())
+            + ') PARTITION BY HASH ("user_id")',
+            'CREATE INDEX {} ON {} ("recipe_id", "user_id")'.format(
+                self.quote(f'{self.index_name}_part'), new),
+        ]
+        statements.extend(
+            f'CREATE TABLE {self.quote(self.partition_name(remainder))} '
+            f'PARTITION OF {new} FOR VALUES WITH '
+            f'(MODULUS {partitions}, REMAINDER {remainder})'
+            for remainder in range(partitions)
+        )
+        statements += [
+            f'CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$ '
+            'BEGIN '
+            "IF TG_OP = 'INSERT' THEN "
+            f'INSERT INTO {new} ({columns}) VALUES ({values}) '
+            'ON CONFLICT DO NOTHING; '
+            'RETURN NEW; '
+            'END IF; '
+            f'DELETE FROM {new} WHERE "id" = OLD."id" '
+            'AND "user_id" = OLD."user_id"; '
+            'RETURN OLD; '
+            'END $$ LANGUAGE plpgsql',
+            f'CREATE TRIGGER {function} AFTER INSERT OR DELETE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {function}()',
+        ]
+        return statements
+
+    def create(self, partitions):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in self.create_sql(partitions):
+                cursor.execute(statement)
+
+    def copy_sql(self):
+        """Перенос одной пачки: id в диапазоне (%s, %s]. FOR SHARE не даёт
+        параллельному удалению проскочить между чтением строки и её
+        вставкой."""
+        table, new = self.quote(self.table), self.quote(self.new_table)
+        columns = ', '.join(self.quote(column) for column in self.columns)
+        return (
+            f'INSERT INTO {new} ({columns}) '
+            f'SELECT {columns} FROM {table} '
+            'WHERE "id" > %s AND "id" <= %s FOR SHARE '
+            'ON CONFLICT DO NOTHING'
+        )
+
+    def copy(self, batch_size, on_batch=None):
+        """Переносит строки пачками по id, каждая пачка в своей
+        транзакции."""
+        table = self.quote(self.table)
+        statement = self.copy_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT min("id"), max("id") FROM {table}')
+            first_id, last_id = cursor.fetchone()
+        if first_id is None:
+            return 0
+        copied = 0
+        for start in range(first_id - 1, last_id, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(statement, [start, start + batch_size])
+                copied += cursor.rowcount
+            if on_batch:
+                on_batch(min(start + batch_size, last_id), last_id)
+        return copied
+
+    def swap_sql(self):
+        table, new = self.quote(self.table), self.quote(self.new_table)
+        function = self.quote(f'{self.table}_mirror')
+        return [
+            f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE',
+            f'DROP TRIGGER {function} ON {table}',
+            f'DROP FUNCTION {function}()',
+            f'ALTER SEQUENCE {self.quote(self.sequence)} '
+            f'OWNED BY {new}."id"',
+            f'ALTER TABLE {table} RENAME TO {self.quote(self.old_table)}',
+            'ALTER TABLE {} RENAME CONSTRAINT {} TO {}'.format(
+                self.quote(self.old_table), self.quote(self.unique_name),
+                self.quote(f'{self.unique_name}_old')),
+            'ALTER INDEX {} RENAME TO {}'.format(
+                self.quote(self.index_name),
+                self.quote(f'{self.index_name}_old')),
+            f'ALTER TABLE {new} RENAME TO {table}',
+            'ALTER TABLE {} RENAME CONSTRAINT {} TO {}'.format(
+                table, self.quote(f'{self.unique_name}_part'),
+                self.quote(self.unique_name)),
+            'ALTER INDEX {} RENAME TO {}'.format(
+                self.quote(f'{self.index_name}_part'),
+                self.quote(self.index_name)),
+        ]
+
+    def swap(self):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in self.swap_sql():
+                cursor.execute(statement)
+
+    def scanned_partitions(self, queryset):
+        """Секции этой таблицы, которые затрагивает план запроса."""
+        plan = queryset.explain()
+        prefix = f'{self.table}_p'
+        return {
+            word for word in plan.replace('(', ' ').split()
+            if word.startswith(prefix) and word[len(prefix):].isdigit()
+        }
@@ -0,0 +1,184 @@
+"""Рейтинг рецептов по событиям избранного и корзины.
+
+Затухающая оценка события с весом w в момент t хранится как
+w * 2 ** ((t - epoch) / half_life). Порядок таких сумм совпадает с
+порядком оценок, затухших к текущему моменту, поэтому новые события
+просто прибавляются, а старые строки не трогаются до смены эпохи.
+
+Строки избранного и корзины, появившиеся до событий, учитываются
+однократным seed_scores (update_ranking --full).
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.utils import timezone
+
+from foodgram.const import (
+    RANKING_BATCH_SIZE,
+    RANKING_CART_WEIGHT,
+    RANKING_FAVORITE_WEIGHT,
+    RANKING_HALF_LIFE_DAY,
+    RANKING_HALF_LIFE_WEEK,
+    RANKING_REBASE_INTERVAL,
+    RANKING_SEED_BATCH_SIZE,
+)
+from .models import (Favorite, Recipe, RecipeActivity, RecipeScore,
+                     ShoppingCart, Watermark)
+
+EVENT_WEIGHTS = {
+    Favorite: RANKING_FAVORITE_WEIGHT,
+    ShoppingCart: RANKING_CART_WEIGHT,
+}
+
+
+def record_activity(model, recipe_id, added=True):
+    weight = EVENT_WEIGHTS[model]
+    RecipeActivity.objects.create(
+        recipe_id=recipe_id, weight=weight if added else -weight
+    )
+
+
+def record_activity_batch(model, added_ids, removed_ids):
+    weight = EVENT_WEIGHTS[model]
+    RecipeActivity.objects.bulk_create([
+        RecipeActivity(recipe_id=recipe_id, weight=weight)
+        for recipe_id in added_ids
+    ] + [
+        RecipeActivity(recipe_id=recipe_id, weight=-weight)
+        for recipe_id in removed_ids
+    ])
+
+
+def get_epoch():
+    epoch, created = Watermark.objects.get_or_create(
+        name='ranking_epoch',
+        defaults={'value': int(timezone.now().timestamp())},
+    )
+    return epoch
+
+
+def lock_epoch():
+    """Эпоха под блокировкой до конца транзакции: пересчёты идут по
+    очереди, и каждый видит значение после смены эпохи соседом."""
+    get_epoch()
+    return Watermark.objects.select_for_update().get(name='ranking_epoch')
+
+
+def rebase(epoch, now):
+    """Переносит эпоху, чтобы множители не росли неограниченно."""
+    shift = now - epoch.value
+    RecipeScore.objects.update(
+        score_week=F('score_week') * 2 ** (-shift / RANKING_HALF_LIFE_WEEK),
+        score_day=F('score_day') * 2 ** (-shift / RANKING_HALF_LIFE_DAY),
+    )
+    epoch.value = now
+    epoch.save(update_fields=('value', 'updated_at'))
+
+
+def roll_up_batch(epoch):
+    """Вызывается с заблокированной эпохой (lock_epoch)."""
+    events = list(
+        RecipeActivity.objects.order_by('id')
+        .values_list('id', 'recipe_id', 'weight', 'created')
+        [:RANKING_BATCH_SIZE]
+    )
+    if not events:
+        return 0
+    deltas = {}
+    for _, recipe_id, weight, created in events:
+        age = created.timestamp() - epoch.value
+        delta = deltas.setdefault(recipe_id, [0, 0, 0])
+        delta[0] += weight
+        delta[1] += weight * 2 ** (age / RANKING_HALF_LIFE_WEEK)
+        delta[2] += weight * 2 ** (age / RANKING_HALF_LIFE_DAY)
+    scores = RecipeScore.objects.in_bulk(deltas)
+    new_scores = []
+    for recipe_id, (score_all, score_week, score_day) in deltas.items():
+        score = scores.get(recipe_id)
+        if score is None:
+            new_scores.append(RecipeScore(
+                recipe_id=recipe_id, score_all=score_all,
+                score_week=score_week, score_day=score_day,
+            ))
+            continue
+        score.score_all += score_all
+        score.score_week += score_week
+        score.score_day += score_day
+    RecipeScore.objects.bulk_update(
+        scores.values(), ('score_all', 'score_week', 'score_day')
+    )
+    RecipeScore.objects.bulk_create(new_scores)
+    RecipeActivity.objects.filter(
+        id__in=[event[0] for event in events]
+    ).delete()
+    return len(events)
+
+
+def update_ranking():
+    """Сворачивает накопленные события в RecipeScore, возвращает их число."""
+    processed = 0
+    while True:
+        with transaction.atomic():
+            epoch = lock_epoch()
+            now = int(timezone.now().timestamp())
+            if now - epoch.value > RANKING_REBASE_INTERVAL:
+                rebase(epoch, now)
+            count = roll_up_batch(epoch)
+        if not count:
+            return processed
+        processed += count
+
+
+def count_totals(first_id, last_id):
+    """score_all рецептов диапазона по текущим строкам за вычетом ещё не
+    свёрнутых событий: они уже отражены в строках и будут прибавлены
+    roll_up_batch. Один запрос, поэтому строки и события видны из одного
+    снимка."""
+    queries = [
+        model.objects.filter(
+            recipe_id__gt=first_id, recipe_id__lte=last_id
+        ).order_by().values('recipe_id').annotate(
+            total=Count('id') * Value(weight)
+        )
+        for model, weight in EVENT_WEIGHTS.items()
+    ]
+    queries.append(
+        RecipeActivity.objects.filter(
+            recipe_id__gt=first_id, recipe_id__lte=last_id
+        ).order_by().values('recipe_id').annotate(
+            total=Sum('weight') * Value(-1)
+        )
+    )
+    totals = {}
+    for row in queries[0].union(*queries[1:], all=True):
+        totals[row['recipe_id']] = (
+            totals.get(row['recipe_id'], 0) + row['total'])
+    return totals
+
+
+def seed_scores(batch_size=RANKING_SEED_BATCH_SIZE):
+    """Пересчитывает score_all по строкам избранного и корзины пачками
+    рецептов, возвращает число пачек.
+
+    Время появления старых строк неизвестно, поэтому недельная и суточная
+    оценки не меняются и копятся только по событиям.
+    """
+    update_ranking()
+    last_id = Recipe.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    batches = 0
+    for start in range(0, last_id, batch_size):
+        with transaction.atomic():
+            # Свёртка событий ждёт: она меняет те же строки RecipeScore
+            lock_epoch()
+            totals = count_totals(start, start + batch_size)
+            scores = RecipeScore.objects.filter(
+                recipe_id__gt=start, recipe_id__lte=start + batch_size
+            ).in_bulk()
+            for recipe_id, score in scores.items():
+                score.score_all = totals.pop(recipe_id, 0)
+            RecipeScore.objects.bulk_update(scores.values(), ('score_all',))
+            RecipeScore.objects.bulk_create(
+                RecipeScore(recipe_id=recipe_id, score_all=total)
+                for recipe_id, total in totals.items() if total
+            )
+        batches += 1
+    return batches
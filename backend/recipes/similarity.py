@@ -0,0 +1,199 @@
+"""Расчёт похожих рецептов по ингредиентам и тегам.
+
+Рецепты представлены разреженной матрицей ингредиентов с весами IDF,
+строки нормированы, так что произведение строк даёт косинусное
+сходство. Теги (их мало) учитываются мерой Жаккара только для
+кандидатов, найденных по общим ингредиентам.
+"""
+from array import array
+from datetime import datetime
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from foodgram.const import (
+    SIMILAR_BATCH_SIZE,
+    SIMILAR_MAX_DF_MIN,
+    SIMILAR_MAX_DF_RATIO,
+    SIMILAR_TAG_WEIGHT,
+    SIMILAR_TOP_K,
+    STREAM_CHUNK_SIZE,
+)
+from .ingredient_index import get_changes_window
+from .models import Recipe, RecipeIngredient, SimilarRecipe, Watermark
+
+# Время начала последнего пересчёта (секунды); журнал RecipeChange
+# удаляется только до этой отметки
+WATERMARK_NAME = 'similar_recipes_synced_at'
+
+
+def get_synced_at():
+    value = Watermark.objects.filter(
+        name=WATERMARK_NAME
+    ).values_list('value', flat=True).first()
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def load_pairs(queryset, fields):
+    left, right = array('q'), array('q')
+    for left_id, right_id in queryset.order_by().values_list(
+        *fields
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE):
+        left.append(left_id)
+        right.append(right_id)
+    return np.frombuffer(left, dtype=np.int64), np.frombuffer(
+        right, dtype=np.int64)
+
+
+class RecipeFeatures:
+
+    def __init__(self):
+        # Рецепты, ожидающие удаления, не попадают в соседи
+        recipe_ids, ingredient_ids = load_pairs(
+            RecipeIngredient.objects.filter(recipe__pending_deletion=False),
+            ('recipe_id', 'ingredient_id')
+        )
+        self.recipe_ids, rows = np.unique(recipe_ids, return_inverse=True)
+        _, columns = np.unique(ingredient_ids, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns)),
+            shape=(len(self.recipe_ids), columns.max(initial=-1) + 1),
+        )
+        self.ingredients = self.weigh(matrix)
+
+        tag_recipe_ids, tag_ids = load_pairs(
+            Recipe.tags.through.objects, ('recipe_id', 'tag_id')
+        )
+        known = np.isin(tag_recipe_ids, self.recipe_ids)
+        _, tag_columns = np.unique(tag_ids[known], return_inverse=True)
+        self.tags = np.zeros(
+            (len(self.recipe_ids), tag_columns.max(initial=-1) + 1),
+            dtype=bool,
+        )
+        self.tags[
+            np.searchsorted(self.recipe_ids, tag_recipe_ids[known]),
+            tag_columns,
+        ] = True
+
+    def weigh(self, matrix):
+        if not matrix.shape[1]:
+            return matrix
+        recipes_count = matrix.shape[0]
+        document_frequency = np.bincount(
+            matrix.indices, minlength=matrix.shape[1])
+        idf = np.log((1 + recipes_count) / (1 + document_frequency)) + 1
+        # Ингредиенты вроде соли есть почти везде: они не различают
+        # рецепты, но делают произведение матриц почти плотным
+        idf[
+            (document_frequency > SIMILAR_MAX_DF_RATIO * recipes_count)
+            & (document_frequency > SIMILAR_MAX_DF_MIN)
+        ] = 0
+        matrix = matrix @ sparse.diags(idf)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        norms[norms == 0] = 1
+        matrix = sparse.csr_matrix(matrix.multiply(1 / norms))
+        matrix.eliminate_zeros()
+        return matrix
+
+    def rows(self, recipe_ids):
+        """Номера строк матрицы для известных id рецептов."""
+        recipe_ids = np.fromiter(recipe_ids, dtype=np.int64)
+        if not len(self.recipe_ids) or not len(recipe_ids):
+            return np.array([], dtype=np.intp)
+        positions = np.searchsorted(self.recipe_ids, recipe_ids)
+        positions = np.minimum(positions, len(self.recipe_ids) - 1)
+        return np.unique(positions[self.recipe_ids[positions] == recipe_ids])
+
+    def top_k(self, rows, top_k=SIMILAR_TOP_K):
+        """Для каждой строки из rows отдаёт (id рецепта, [(id, score)])."""
+        cosine = self.ingredients[rows] @ self.ingredients.T
+        cosine = sparse.csr_matrix(cosine)
+        for position, row in enumerate(rows):
+            start, end = cosine.indptr[position:position + 2]
+            candidates = cosine.indices[start:end]
+            scores = cosine.data[start:end]
+            mask = candidates != row
+            candidates, scores = candidates[mask], scores[mask]
+            if len(candidates) > 0 and self.tags.shape[1]:
+                tags, candidate_tags = self.tags[row], self.tags[candidates]
+                union = (candidate_tags | tags).sum(axis=1)
+                jaccard = np.divide(
+                    (candidate_tags & tags).sum(axis=1), union,
+                    out=np.zeros(len(candidates)), where=union > 0,
+                )
+                scores = ((1 - SIMILAR_TAG_WEIGHT) * scores
+                          + SIMILAR_TAG_WEIGHT * jaccard)
+            if len(candidates) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                candidates, scores = candidates[best], scores[best]
+            order = np.argsort(-scores, kind='stable')
+            yield int(self.recipe_ids[row]), [
+                (int(self.recipe_ids[candidate]), float(score))
+                for candidate, score in zip(candidates[order], scores[order])
+            ]
+
+
+def get_changed_recipe_ids(since):
+    changed = set(
+        get_changes_window(since).values_list('recipe_id', flat=True)
+    )
+    if not changed:
+        return changed
+    # Рецепты, у которых изменённый рецепт сейчас в списке похожих
+    referencing = SimilarRecipe.objects.filter(
+        similar_id__in=changed
+    ).values_list('recipe_id', flat=True)
+    return changed.union(referencing)
+
+
+def save_batch(features, rows, top_k):
+    with transaction.atomic():
+        recipe_ids = features.recipe_ids[rows].tolist()
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, similar in features.top_k(rows, top_k)
+            for similar_id, score in similar
+        )
+
+
+def update_similar_recipes(full=False, top_k=SIMILAR_TOP_K,
+                           batch_size=SIMILAR_BATCH_SIZE):
+    """Пересчитывает похожие рецепты, возвращает число обработанных.
+
+    Без full пересчитываются только рецепты, изменённые после прошлого
+    запуска (с запасом RECIPE_CHANGES_LAG), и рецепты, ссылающиеся на
+    них.
+    """
+    started_at = timezone.now()
+    synced_at = get_synced_at()
+    if full or synced_at is None:
+        targets = None
+    else:
+        targets = get_changed_recipe_ids(synced_at)
+    features = RecipeFeatures()
+    if targets is None:
+        rows = np.arange(len(features.recipe_ids))
+    else:
+        rows = features.rows(targets)
+        # Удалённые рецепты и рецепты без ингредиентов
+        SimilarRecipe.objects.filter(recipe_id__in=targets).exclude(
+            recipe_id__in=features.recipe_ids[rows].tolist()
+        ).delete()
+        # Новые соседи изменённых рецептов тоже пересчитываются
+        neighbours = set()
+        for _, similar in features.top_k(rows, top_k):
+            neighbours.update(similar_id for similar_id, _ in similar)
+        rows = np.union1d(rows, features.rows(neighbours))
+    for start in range(0, len(rows), batch_size):
+        save_batch(features, rows[start:start + batch_size], top_k)
+    Watermark.objects.update_or_create(
+        name=WATERMARK_NAME,
+        defaults={'value': int(started_at.timestamp())},
+    )
+    return len(rows)
@@ -0,0 +1,312 @@
+"""Отложенная запись избранного и корзины (write-behind).
+
+Переключение дописывается в журнал процесса на локальном диске (с
+fsync) и в кэш ожидающих изменений пользователя, после чего запрос
+сразу получает ответ. Фоновый поток процесса раз в
+TOGGLE_FLUSH_INTERVAL секунд забирает журнал, схлопывает переключения
+по (модель, пользователь, рецепт) и применяет их пачкой
+bulk_create/DELETE. Чтения объединяют данные БД с ожидающими
+изменениями через get_pending_ids.
+
+Процесс держит flock на своём журнале, пока пишет и применяет его.
+Журналы без блокировки (старше TOGGLE_ORPHAN_AGE) остались от
+остановленных или упавших процессов: их подбирают остальные процессы и
+команда flush_toggles. Применение идемпотентно, поэтому повторная
+обработка журнала после сбоя безопасна.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from foodgram.const import (
+    TOGGLE_FLUSH_INTERVAL,
+    TOGGLE_ORPHAN_AGE,
+    TOGGLE_PENDING_LOCK_TIMEOUT,
+    TOGGLE_PENDING_LOCK_WAIT,
+    TOGGLE_PENDING_TIMEOUT,
+)
+from .models import Favorite, Recipe, ShoppingCart
+from .ranking import record_activity_batch
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+MODELS = {model._meta.model_name: model for model in (Favorite, ShoppingCart)}
+
+
+def get_pending_key(model, user_id):
+    return f'toggles:{model._meta.model_name}:{user_id}'
+
+
+def get_pending(model, user_id):
+    """Ожидающие записи переключения: {recipe_id: (added, время)}."""
+    return cache.get(get_pending_key(model, user_id)) or {}
+
+
+@contextmanager
+def locked_pending(model, user_id):
+    """Ожидающие переключения пользователя для изменения на месте.
+
+    Словарь читается и записывается целиком, поэтому изменения идут под
+    блокировкой в кэше: иначе два процесса, одновременно меняющие список
+    одного пользователя, теряют одно из изменений. Блокировка упавшего
+    владельца истекает через TOGGLE_PENDING_LOCK_TIMEOUT.
+    """
+    key = get_pending_key(model, user_id)
+    lock_key = f'{key}:lock'
+    while not cache.add(lock_key, 1, TOGGLE_PENDING_LOCK_TIMEOUT):
+        time.sleep(TOGGLE_PENDING_LOCK_WAIT)
+    try:
+        pending = get_pending(model, user_id)
+        yield pending
+        if pending:
+            cache.set(key, pending, TOGGLE_PENDING_TIMEOUT)
+        else:
+            cache.delete(key)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_pending_ids(model, user_id):
+    """id рецептов, ожидающих добавления и удаления."""
+    if not settings.TOGGLE_WRITE_BEHIND or not user_id:
+        return [], []
+    pending = get_pending(model, user_id)
+    added = [pk for pk, (is_added, _) in pending.items() if is_added]
+    removed = [pk for pk, (is_added, _) in pending.items() if not is_added]
+    return added, removed
+
+
+def merge_pending(model, user_id, exists):
+    """Аннотация «рецепт в списке» с учётом ожидающих переключений."""
+    added, removed = get_pending_ids(model, user_id)
+    if not added and not removed:
+        return exists
+    condition = Q(exists) & ~Q(pk__in=removed) | Q(pk__in=added)
+    return ExpressionWrapper(condition, output_field=BooleanField())
+
+
+def is_in_list(model, user_id, recipe_id):
+    pending = get_pending(model, user_id).get(recipe_id)
+    if pending is not None:
+        return pending[0]
+    return model.objects.filter(
+        user_id=user_id, recipe_id=recipe_id
+    ).exists()
+
+
+def claim(path):
+    """Атомарно забирает журнал на обработку, None - если его уже забрали."""
+    target = path.with_name(f'{path.stem}.{uuid.uuid4().hex[:8]}.flushing')
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        return None
+    return target
+
+
+def read_toggles(path):
+    toggles = {}
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                name, user_id, recipe_id, added, logged_at = json.loads(line)
+            except ValueError:
+                # Недописанная при сбое строка
+                continue
+            toggles[(name, user_id, recipe_id)] = (added, logged_at)
+    return toggles
+
+
+def clear_pending(model, toggles):
+    """Убирает из кэша применённые переключения, более новые оставляет."""
+    by_user = {}
+    for (user_id, recipe_id), (_, logged_at) in toggles.items():
+        by_user.setdefault(user_id, {})[recipe_id] = logged_at
+    for user_id, applied in by_user.items():
+        with locked_pending(model, user_id) as pending:
+            for recipe_id, logged_at in applied.items():
+                if recipe_id in pending and pending[recipe_id][1] <= logged_at:
+                    del pending[recipe_id]
+
+
+def apply_model_toggles(model, toggles):
+    """toggles: {(user_id, recipe_id): (added, время)}."""
+    user_ids = {user_id for user_id, _ in toggles}
+    recipe_ids = {recipe_id for _, recipe_id in toggles}
+    pending = {user_id: get_pending(model, user_id) for user_id in user_ids}
+    # Более новое переключение из журнала другого процесса он и применит
+    actual = {
+        key: added for key, (added, logged_at) in toggles.items()
+        if pending[key[0]].get(key[1], (None, 0))[1] <= logged_at
+    }
+    existing = {
+        (user_id, recipe_id): pk
+        for pk, user_id, recipe_id in model.objects.filter(
+            user_id__in=user_ids, recipe_id__in=recipe_ids
+        ).values_list('id', 'user_id', 'recipe_id')
+    }
+    valid_users = set(User.objects.filter(
+        id__in=user_ids, pending_deletion=False
+    ).values_list('id', flat=True))
+    valid_recipes = set(Recipe.objects.filter(
+        id__in=recipe_ids, pending_deletion=False
+    ).values_list('id', flat=True))
+    to_add = [
+        key for key, added in actual.items()
+        if added and key not in existing
+        and key[0] in valid_users and key[1] in valid_recipes
+    ]
+    to_remove = [
+        key for key, added in actual.items()
+        if not added and key in existing
+    ]
+    with transaction.atomic():
+        model.objects.bulk_create([
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in to_add
+        ], ignore_conflicts=True)
+        model.objects.filter(
+            pk__in=[existing[key] for key in to_remove]
+        ).delete()
+        record_activity_batch(
+            model,
+            [recipe_id for _, recipe_id in to_add],
+            [recipe_id for _, recipe_id in to_remove],
+        )
+    clear_pending(model, toggles)
+    return len(to_add) + len(to_remove)
+
+
+def apply_file(path):
+    """Применяет забранный журнал и удаляет его, возвращает число
+    изменённых строк."""
+    toggles = read_toggles(path)
+    changed = 0
+    for name, model in MODELS.items():
+        model_toggles = {
+            (user_id, recipe_id): value
+            for (toggle_name, user_id, recipe_id), value in toggles.items()
+            if toggle_name == name
+        }
+        if model_toggles:
+            changed += apply_model_toggles(model, model_toggles)
+    path.unlink(missing_ok=True)
+    return changed
+
+
+def recover_orphans(orphan_age=TOGGLE_ORPHAN_AGE):
+    """Применяет журналы остановленных или упавших процессов."""
+    directory = Path(settings.TOGGLE_LOG_DIR)
+    if not directory.exists():
+        return 0
+    changed = 0
+    deadline = time.time() - orphan_age
+    for path in (*directory.glob('*.log'), *directory.glob('*.flushing')):
+        try:
+            if path.stat().st_mtime > deadline:
+                continue
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        with file:
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Владелец жив: пишет журнал или ещё применяет его
+                continue
+            claimed = claim(path)
+            if claimed:
+                changed += apply_file(claimed)
+    return changed
+
+
+class ToggleLog:
+    """Журнал переключений одного процесса и его фоновый поток записи."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / (
+            f'{socket.gethostname()}-{os.getpid()}-'
+            f'{uuid.uuid4().hex[:8]}.log'
+        )
+        self.lock = threading.Lock()
+        self.file = None
+        self.flusher = None
+        atexit.register(self.flush)
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        # Держится до применения журнала: по ней recover_orphans
+        # отличает журналы живых процессов
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def append(self, model, user_id, recipe_id, added):
+        logged_at = time.time()
+        line = json.dumps([
+            model._meta.model_name, user_id, recipe_id, added, logged_at
+        ])
+        with self.lock:
+            if self.file is None:
+                self.open()
+            self.file.write(line + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run, name='toggle-flusher', daemon=True
+                )
+                self.flusher.start()
+        with locked_pending(model, user_id) as pending:
+            pending[recipe_id] = (added, logged_at)
+
+    def flush(self):
+        with self.lock:
+            file, self.file = self.file, None
+            if file is None:
+                return 0
+            claimed = claim(self.path)
+        # Блокировка снимается только после применения журнала
+        with file:
+            if claimed:
+                return apply_file(claimed)
+            return 0
+
+    def run(self):
+        while True:
+            time.sleep(TOGGLE_FLUSH_INTERVAL)
+            close_old_connections()
+            try:
+                self.flush()
+                recover_orphans()
+            except Exception:
+                logger.exception('Не удалось записать переключения')
+            finally:
+                close_old_connections()
+
+
+toggle_logs = {}
+
+
+def get_toggle_log():
+    # Отдельный журнал на процесс: с gunicorn --preload модуль
+    # импортируется до fork
+    pid = os.getpid()
+    if pid not in toggle_logs:
+        toggle_logs[pid] = ToggleLog(settings.TOGGLE_LOG_DIR)
+    return toggle_logs[pid]